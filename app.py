@@ -5,69 +5,170 @@ Simple interface with Adani company colors (Navy Blue & Orange)
 """
 
 import os
-from flask import Flask, render_template, request, jsonify, session
+import hashlib
+import logging
+import shutil
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from itertools import chain
+import httpx
+import orjson
+from flask import Flask, request, jsonify, session
+from flask.json.provider import JSONProvider
+from flask_compress import Compress
+from cachetools import TTLCache
 from dotenv import load_dotenv
+from openai import OpenAI
 import uuid
+from pathlib import Path
+from werkzeug.utils import secure_filename
 
 load_dotenv()
 
-from pdf_processor import extract_text_from_pdf, get_pdf_metadata
-from chunker import create_chunks
+from pdf_processor import get_pdf_metadata, MP_CONTEXT, preload_worker_modules
+from ingest_worker import process_pdf
 from retriever import HybridRetriever
 from chat_agent import ConversationalAgent
 
+logger = logging.getLogger(__name__)
+
+
+class ORJSONProvider(JSONProvider):
+    """JSON provider backed by orjson, used by jsonify() and request.json."""
+
+    def dumps(self, obj, **kwargs):
+        return orjson.dumps(obj, option=orjson.OPT_SERIALIZE_NUMPY | orjson.OPT_NON_STR_KEYS).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Flask(__name__)
-app.secret_key = os.urandom(24)
+app.json = ORJSONProvider(app)
+
+# Read from the environment so sessions stay valid across restarts; the random
+# fallback is generated before gunicorn forks, so all workers still agree on it.
+app.secret_key = os.getenv("FLASK_SECRET_KEY") or os.urandom(24)
 
-# Global chatbot instance
+# Keep sessions server-side in Redis when configured (shared by all workers);
+# otherwise fall back to Flask's signed cookie sessions
+if os.getenv("REDIS_URL"):
+    import redis
+    from flask_session import Session
+
+    app.config['SESSION_TYPE'] = 'redis'
+    app.config['SESSION_REDIS'] = redis.Redis.from_url(os.environ["REDIS_URL"])
+    Session(app)
+
+# Compress the inline page and JSON payloads (brotli, falling back to gzip)
+app.config['COMPRESS_MIMETYPES'] = ['text/html', 'application/json']
+app.config['COMPRESS_ALGORITHM'] = ['br', 'gzip']
+Compress(app)
+
+UPLOAD_DIR = Path('./uploads')
+
+# Global chatbot instance, built once per process by _init_chatbot()
 chatbot = None
+_chatbot_lock = threading.Lock()
+
+# Per-session agents are evicted after an hour of inactivity
+MAX_SESSIONS = 1024
+SESSION_TTL_SECONDS = 3600
+_agents_lock = threading.Lock()
+
 
+def _new_agent_cache():
+    """Create the bounded per-session agent store."""
+    return TTLCache(maxsize=MAX_SESSIONS, ttl=SESSION_TTL_SECONDS)
 
-def get_chatbot():
-    """Initialize or return existing chatbot instance."""
+
+def _init_chatbot():
+    """Create the shared retriever and load any existing index."""
     global chatbot
-    if chatbot is None:
-        retriever = HybridRetriever(
-            collection_name="document_chunks",
-            persist_directory="./chroma_db"
+    UPLOAD_DIR.mkdir(parents=True, exist_ok=True)
+
+    # One pooled HTTP/2 client for every agent and the retriever
+    openai_client = OpenAI(
+        api_key=os.getenv("OPENAI_API_KEY"),
+        http_client=httpx.Client(
+            http2=True,
+            limits=httpx.Limits(max_connections=100, max_keepalive_connections=20)
         )
-        chatbot = {
-            'retriever': retriever,
-            'agents': {}  # Per-session agents
-        }
-        # Try to load existing index
-        try:
-            collections = retriever.chroma_client.list_collections()
-            for col in collections:
-                if col.name == "document_chunks":
-                    count = retriever.chroma_client.get_collection("document_chunks").count()
-                    if count > 0:
-                        retriever.collection = retriever.chroma_client.get_collection("document_chunks")
-                        retriever._rebuild_bm25_from_collection()
-                        chatbot['indexed'] = True
-                        break
-        except:
-            chatbot['indexed'] = False
+    )
+    # Open the connection now so the first chat doesn't pay for the TLS handshake
+    try:
+        openai_client.models.list()
+    except Exception as e:
+        logger.warning("Could not pre-warm OpenAI connection: %s", e)
+
+    retriever = HybridRetriever(
+        collection_name="document_chunks",
+        persist_directory="./chroma_db",
+        openai_client=openai_client
+    )
+    bot = {
+        'openai_client': openai_client,
+        'retriever': retriever,
+        'agents': _new_agent_cache(),  # Per-session agents
+        'collection': None,
+        'chunk_count': 0,
+        'indexed': False
+    }
+    # Try to load existing index
+    try:
+        collection = retriever.chroma_client.get_collection("document_chunks")
+        count = collection.count()
+        if count > 0:
+            retriever.collection = collection
+            retriever._rebuild_bm25_from_collection()
+            bot['collection'] = collection
+            bot['chunk_count'] = count
+            bot['indexed'] = True
+    except Exception as e:
+        # Cache the negative result; /chat short-circuits on 'indexed'
+        logger.warning("No existing index loaded: %s", e)
+        bot['indexed'] = False
+    chatbot = bot
     return chatbot
 
 
+@app.before_request
+def _ensure_chatbot():
+    """Initialize the chatbot on first use if no startup hook has done it."""
+    if chatbot is None:
+        with _chatbot_lock:
+            if chatbot is None:
+                _init_chatbot()
+
+
 def get_agent(session_id):
     """Get or create agent for session."""
-    bot = get_chatbot()
-    if session_id not in bot['agents']:
-        bot['agents'][session_id] = ConversationalAgent(
-            retriever=bot['retriever'],
-            model="gpt-4o"  # Best model for natural conversation
-        )
-    return bot['agents'][session_id]
+    with _agents_lock:
+        agents = chatbot['agents']
+        agent = agents.get(session_id)
+        if agent is None:
+            agent = ConversationalAgent(
+                retriever=chatbot['retriever'],
+                model="gpt-4o",  # Best model for natural conversation
+                openai_client=chatbot['openai_client']
+            )
+        # Re-insert on every use so the TTL counts from the last request
+        agents[session_id] = agent
+    return agent
 
 
 @app.route('/')
 def index():
-    """Render main chat interface."""
-    if 'session_id' not in session:
-        session['session_id'] = str(uuid.uuid4())
-    return render_template('index.html')
+    """Render main chat interface, letting the browser cache it between deploys."""
+    # Flask-Compress appends ":<encoding>" to the ETag of compressed responses
+    client_tags = request.if_none_match.as_set(include_weak=True)
+    if any(tag.split(':', 1)[0] == TEMPLATE_ETAG for tag in client_tags):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(TEMPLATE_HTML, mimetype='text/html')
+    response.set_etag(TEMPLATE_ETAG)
+    response.headers['Cache-Control'] = 'public, max-age=86400'
+    return response
 
 
 @app.route('/chat', methods=['POST'])
@@ -80,10 +181,12 @@ def chat():
     if not message:
         return jsonify({'error': 'Empty message'}), 400
 
-    session_id = session.get('session_id', str(uuid.uuid4()))
-    bot = get_chatbot()
+    # Created here rather than in index(), which may be served from cache
+    if 'session_id' not in session:
+        session['session_id'] = str(uuid.uuid4())
+    session_id = session['session_id']
 
-    if not bot.get('indexed'):
+    if not chatbot.get('indexed'):
         return jsonify({
             'error': 'No document indexed. Please upload a PDF first.',
             'answer': 'Please upload a PDF document first using the upload button.',
@@ -94,25 +197,27 @@ def chat():
         agent = get_agent(session_id)
         answer, retrieved_chunks = agent.ask(message, top_k=5, show_debug=False)
 
-        # Format retrieved chunks for display
-        retrieved_display = []
-        for chunk in retrieved_chunks:
-            retrieved_display.append({
-                'citation': chunk['citation'],
-                'page': chunk['page_num'],
-                'chunk_id': chunk['chunk_id'],
-                'text': chunk['text'][:400] + '...' if len(chunk['text']) > 400 else chunk['text'],
-                'vector_score': chunk.get('vector_score', 0),
-                'bm25_score': chunk.get('bm25_score', 0),
-                'combined_score': chunk.get('combined_score', 0)
-            })
+        # Format retrieved chunks for display (only when the debug panel wants them)
+        retrieved_display = [
+            {
+                'citation': c['citation'],
+                'page': c['page_num'],
+                'chunk_id': c['chunk_id'],
+                'text': c['text'][:400] + ('...' if len(c['text']) > 400 else ''),
+                'vector_score': c.get('vector_score', 0),
+                'bm25_score': c.get('bm25_score', 0),
+                'combined_score': c.get('combined_score', 0)
+            }
+            for c in retrieved_chunks
+        ] if show_debug else []
 
         return jsonify({
             'answer': answer,
-            'retrieved': retrieved_display if show_debug else []
+            'retrieved': retrieved_display
         })
 
     except Exception as e:
+        logger.exception("Chat request failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -122,65 +227,62 @@ def upload():
     if 'files' not in request.files and 'file' not in request.files:
         return jsonify({'error': 'No files provided'}), 400
 
-    # Support both single file (legacy) and multiple files
-    files = request.files.getlist('files')
-    if not files or all(f.filename == '' for f in files):
-        # Fallback to single file
-        if 'file' in request.files:
-            files = [request.files['file']]
-        else:
-            return jsonify({'error': 'No files selected'}), 400
-
-    # Filter valid PDF files
-    pdf_files = [f for f in files if f.filename and f.filename.lower().endswith('.pdf')]
+    # Support both multiple files and the legacy single 'file' field,
+    # keeping only real PDF uploads in one pass
+    pdf_files = [
+        f for f in chain(request.files.getlist('files'), request.files.getlist('file'))
+        if f.filename and f.filename.lower().endswith('.pdf')
+    ]
 
     if not pdf_files:
         return jsonify({'error': 'No valid PDF files provided. Only PDF files are supported.'}), 400
 
     try:
-        os.makedirs('./uploads', exist_ok=True)
-        bot = get_chatbot()
+        # Save all uploads first so extraction can run in parallel
+        upload_paths = []
+        filenames = []
+        for file in pdf_files:
+            # Strip path components so a crafted name can't escape UPLOAD_DIR, and
+            # prefix a unique id so uploads with the same name don't overwrite
+            # each other; the original name is only used for citations
+            upload_path = UPLOAD_DIR / f"{uuid.uuid4().hex}_{secure_filename(file.filename) or 'upload.pdf'}"
+            with open(upload_path, 'wb', buffering=0) as out:
+                shutil.copyfileobj(file.stream, out, length=1024 * 1024)
+            upload_paths.append(upload_path)
+            filenames.append(file.filename)
+
+        # Extract and chunk each PDF on its own core
+        multi = len(pdf_files) > 1
+        if multi:
+            with ProcessPoolExecutor(
+                max_workers=min(len(pdf_files), os.cpu_count() or 1), mp_context=MP_CONTEXT
+            ) as executor:
+                results = list(executor.map(
+                    process_pdf, upload_paths, filenames, [multi] * len(pdf_files)
+                ))
+        else:
+            results = [process_pdf(upload_paths[0], filenames[0], multi)]
 
         all_chunks = []
         total_pages = 0
-        processed_files = []
-
-        for file in pdf_files:
-            # Save uploaded file
-            upload_path = os.path.join('./uploads', file.filename)
-            file.save(upload_path)
-
-            # Extract text from PDF
-            pages_data = extract_text_from_pdf(upload_path)
-
-            # Add source filename to page data for better citations
-            for page in pages_data:
-                page['source_file'] = file.filename
-
-            # Create chunks for this file
-            file_chunks = create_chunks(pages_data, chunk_size=500, chunk_overlap=100)
-
-            # Update chunk citations to include filename for multi-file scenarios
-            if len(pdf_files) > 1:
-                short_name = file.filename[:20] + '...' if len(file.filename) > 20 else file.filename
-                for chunk in file_chunks:
-                    chunk['source_file'] = file.filename
-                    chunk['citation'] = f"[{short_name}:p{chunk['page_num']}:c{chunk['chunk_id']}]"
-
+        for file_chunks, n_pages in results:
             all_chunks.extend(file_chunks)
-            total_pages += len(pages_data)
-            processed_files.append(file.filename)
+            total_pages += n_pages
+        processed_files = filenames
 
         # Reindex chunk IDs to be unique across all files
         for i, chunk in enumerate(all_chunks):
             chunk['chunk_id'] = i
 
         # Index all chunks
-        bot['retriever'].index_chunks(all_chunks, force_reindex=True)
-        bot['indexed'] = True
+        chatbot['retriever'].index_chunks(all_chunks, force_reindex=True)
+        chatbot['collection'] = chatbot['retriever'].collection
+        chatbot['chunk_count'] = len(all_chunks)
+        chatbot['indexed'] = True
 
         # Clear all agents (new documents)
-        bot['agents'] = {}
+        with _agents_lock:
+            chatbot['agents'] = _new_agent_cache()
 
         return jsonify({
             'success': True,
@@ -192,8 +294,7 @@ def upload():
         })
 
     except Exception as e:
-        import traceback
-        traceback.print_exc()
+        logger.exception("Upload failed")
         return jsonify({'error': str(e)}), 500
 
 
@@ -202,32 +303,23 @@ def clear_history():
     """Clear conversation history for current session."""
     session_id = session.get('session_id')
     if session_id:
-        bot = get_chatbot()
-        if session_id in bot['agents']:
-            bot['agents'][session_id].clear_history()
+        with _agents_lock:
+            agent = chatbot['agents'].get(session_id)
+        if agent is not None:
+            agent.clear_history()
     return jsonify({'success': True})
 
 
 @app.route('/status')
 def status():
     """Check system status."""
-    bot = get_chatbot()
-    indexed = bot.get('indexed', False)
-    chunk_count = 0
-
-    if indexed:
-        try:
-            chunk_count = bot['retriever'].collection.count()
-        except:
-            pass
-
     return jsonify({
-        'indexed': indexed,
-        'chunk_count': chunk_count
+        'indexed': chatbot['indexed'],
+        'chunk_count': chatbot['chunk_count']
     })
 
 
-# Create templates directory and HTML template
+# Chat UI page, returned verbatim by index() (it contains no Jinja syntax)
 TEMPLATE_HTML = '''
 <!DOCTYPE html>
 <html lang="en">
@@ -943,19 +1035,42 @@ TEMPLATE_HTML = '''
 </body>
 </html>
 '''
+TEMPLATE_ETAG = hashlib.md5(TEMPLATE_HTML.encode()).hexdigest()
+
 
+def run_server(host: str, port: int) -> None:
+    """
+    Serve the app with gunicorn (threaded workers), or Flask's server where
+    gunicorn is unavailable (e.g. Windows).
+    """
+    workers = int(os.getenv("WEB_CONCURRENCY", "1"))
+    threads = int(os.getenv("WEB_THREADS", "4"))
+    # Gunicorn workers inherit this setting when they fork from the master
+    preload_worker_modules()
 
-def create_templates():
-    """Create templates directory and write HTML."""
-    os.makedirs('templates', exist_ok=True)
-    with open('templates/index.html', 'w') as f:
-        f.write(TEMPLATE_HTML)
+    try:
+        from gunicorn.app.base import BaseApplication
+    except ImportError:
+        _init_chatbot()
+        app.run(host=host, port=port, threaded=True)
+        return
 
+    class GunicornApp(BaseApplication):
+        def load_config(self):
+            self.cfg.set('bind', f"{host}:{port}")
+            self.cfg.set('workers', workers)
+            self.cfg.set('threads', threads)
+            self.cfg.set('worker_class', 'gthread')
+            # Each worker builds its own Chroma client after the fork
+            self.cfg.set('post_worker_init', lambda worker: _init_chatbot())
 
-if __name__ == '__main__':
-    # Create templates on startup
-    create_templates()
+        def load(self):
+            return app
+
+    GunicornApp().run()
 
+
+if __name__ == '__main__':
     # Check for API key
     if not os.getenv("OPENAI_API_KEY"):
         print("Error: OPENAI_API_KEY not set")
@@ -968,5 +1083,4 @@ if __name__ == '__main__':
     print("\nOpen http://localhost:5001 in your browser")
     print("Press Ctrl+C to stop\n")
 
-    app.run(host="0.0.0.0", port=5001, debug=True)
-
+    run_server(host="0.0.0.0", port=5001)
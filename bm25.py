@@ -0,0 +1,125 @@
+"""
+Sparse BM25 Module
+Okapi BM25 with every (term, document) contribution computed at index time.
+"""
+
+from collections import Counter
+from typing import Dict, List
+import numpy as np
+from scipy.sparse import csr_matrix
+
+# Optional compiled accumulation loop (needs numba)
+try:
+    from bm25_numba import accumulate_scores
+except ImportError:
+    accumulate_scores = None
+
+
+class SparseBM25:
+    """
+    Drop-in replacement for rank_bm25.BM25Okapi (same scores, same
+    parameters). The index is a |V| x N sparse matrix whose nonzeros are
+    the precomputed BM25 contributions, so scoring a query is a row
+    selection plus a column sum. Contributions are float32 and indices
+    int32; scores still accumulate in float64.
+    """
+
+    def __init__(
+        self,
+        corpus: List[List[str]],
+        k1: float = 1.5,
+        b: float = 0.75,
+        epsilon: float = 0.25
+    ):
+        self.k1 = k1
+        self.b = b
+        self.epsilon = epsilon
+        self.corpus_size = len(corpus)
+
+        # One (term, doc, tf) triple per distinct term of each document
+        self.vocab = {}
+        term_ids = []
+        doc_ids = []
+        tfs = []
+        doc_len = np.empty(self.corpus_size, dtype=np.float32)
+        for doc_id, document in enumerate(corpus):
+            doc_len[doc_id] = len(document)
+            for term, tf in Counter(document).items():
+                term_ids.append(self.vocab.setdefault(term, len(self.vocab)))
+                doc_ids.append(doc_id)
+                tfs.append(tf)
+
+        term_ids = np.array(term_ids, dtype=np.int32)
+        doc_ids = np.array(doc_ids, dtype=np.int32)
+        tfs = np.array(tfs, dtype=np.float32)
+
+        # IDF with BM25Okapi's floor: terms in more than half of the documents
+        # get epsilon * average idf instead of a negative weight
+        df = np.bincount(term_ids, minlength=len(self.vocab))
+        idf = np.log(self.corpus_size - df + 0.5) - np.log(df + 0.5)
+        if idf.size:
+            idf[idf < 0] = self.epsilon * idf.mean()
+        self.idf = idf.astype(np.float32)
+
+        self.doc_len = doc_len
+        self.avgdl = float(doc_len.sum(dtype=np.float64)) / self.corpus_size if self.corpus_size else 0.0
+        # Length normalisation k1 * (1 - b + b * dl / avgdl), once per document
+        # rather than once per posting
+        self.len_norm = (k1 * (1 - b + b * doc_len / (self.avgdl or 1.0))).astype(np.float32)
+        data = self.idf[term_ids] * tfs * np.float32(k1 + 1) / (tfs + self.len_norm[doc_ids])
+
+        # CSR so that selecting the query's term rows is cheap
+        self.matrix = csr_matrix(
+            (data, (term_ids, doc_ids)), shape=(len(self.vocab), self.corpus_size),
+            dtype=np.float32
+        )
+
+    def to_arrays(self) -> Dict[str, np.ndarray]:
+        """
+        The index as plain numeric arrays (for np.savez); the vocab is
+        stored separately by the caller.
+        """
+        return {
+            'indptr': self.matrix.indptr,
+            'indices': self.matrix.indices,
+            'data': self.matrix.data,
+            'idf': self.idf,
+            'doc_len': self.doc_len,
+            'len_norm': self.len_norm,
+            'params': np.array([self.k1, self.b, self.epsilon, self.avgdl])
+        }
+
+    @classmethod
+    def from_arrays(cls, arrays: Dict[str, np.ndarray], vocab: Dict[str, int]) -> "SparseBM25":
+        """
+        Rebuild an index saved with to_arrays without re-tokenizing.
+        """
+        index = cls.__new__(cls)
+        index.k1, index.b, index.epsilon, index.avgdl = (float(x) for x in arrays['params'])
+        index.vocab = vocab
+        index.idf = arrays['idf']
+        index.doc_len = arrays['doc_len']
+        index.len_norm = arrays['len_norm']
+        index.corpus_size = len(index.doc_len)
+        index.matrix = csr_matrix(
+            (arrays['data'], arrays['indices'], arrays['indptr']),
+            shape=(len(vocab), index.corpus_size)
+        )
+        return index
+
+    def get_scores(self, query: List[str]) -> np.ndarray:
+        """
+        BM25 score of every document for a tokenized query. Repeated query
+        terms count once per occurrence, as in BM25Okapi.
+        """
+        rows = [self.vocab[term] for term in query if term in self.vocab]
+        if not rows:
+            return np.zeros(self.corpus_size)
+        if accumulate_scores is not None:
+            scores = np.zeros(self.corpus_size)
+            accumulate_scores(
+                self.matrix.indptr, self.matrix.indices, self.matrix.data,
+                np.array(rows, dtype=np.int64), scores
+            )
+            return scores
+        return np.asarray(self.matrix[rows].sum(axis=0, dtype=np.float64)).ravel()
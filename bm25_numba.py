@@ -0,0 +1,26 @@
+"""
+Numba BM25 Kernel
+Compiled score accumulation over SparseBM25's CSR arrays. Importing this
+module requires numba; bm25.py falls back to scipy without it.
+"""
+
+import numpy as np
+from numba import njit
+
+
+@njit(cache=True)
+def accumulate_scores(
+    indptr: np.ndarray,
+    indices: np.ndarray,
+    data: np.ndarray,
+    term_ids: np.ndarray,
+    out: np.ndarray
+) -> None:
+    """
+    Add each query term's row of BM25 contributions into out (one slot per
+    document). Serial on purpose: query terms share documents, so a
+    parallel loop over terms would race on out.
+    """
+    for t in term_ids:
+        for p in range(indptr[t], indptr[t + 1]):
+            out[indices[p]] += data[p]
@@ -4,10 +4,31 @@ Handles multi-turn conversations with grounded answers and citations.
 """
 
 import os
-from typing import List, Dict, Any, Optional, Tuple
-from openai import OpenAI
+import re
+import asyncio
+import hashlib
+import threading
+import weakref
+from collections import OrderedDict, deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import List, Dict, Any, Optional, Tuple, Callable, Deque
+import httpx
+from openai import OpenAI, AsyncOpenAI
 from retriever import HybridRetriever
 
+# Shared pool for speculative retrieval that overlaps query reformulation
+_retrieval_executor = ThreadPoolExecutor(max_workers=8, thread_name_prefix="retrieval")
+
+# Citation markers ("[p3]", "[p3:c12]", "[c12]") and the refusal phrase
+_CITE_RE = re.compile(r'\[[pc]')
+_NOT_FOUND = "not found in the document"
+
+# Words that signal a follow-up leaning on earlier turns
+_FOLLOWUP_RE = re.compile(
+    r'\b(it|they|them|this|that|he|she|those|these|there|also|and|too)\b',
+    re.IGNORECASE
+)
+
 
 class ConversationalAgent:
     """
@@ -19,15 +40,29 @@ class ConversationalAgent:
         retriever: HybridRetriever,
         model: str = "gpt-4o",
         temperature: float = 0.2,
-        max_history_turns: int = 10
+        max_history_turns: int = 10,
+        openai_client: Optional[OpenAI] = None,
+        async_openai_client: Optional[AsyncOpenAI] = None
     ):
         self.retriever = retriever
         self.model = model
         self.temperature = temperature
         self.max_history_turns = max_history_turns
 
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        self.openai_client = openai_client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # A client passed in is used as-is; otherwise one is created per event
+        # loop, since its connection pool is tied to the loop it first ran on
+        self._async_openai_client = async_openai_client
+        self._loop_async_clients = weakref.WeakKeyDictionary()
         self.conversation_history: List[Dict[str, str]] = []
+        # Retrieved chunks of the last few turns, for debugging
+        self.recent_retrievals: Deque[List[Dict[str, Any]]] = deque(maxlen=3)
+
+        # LRU of reformulations keyed on (recent history, query); safe because
+        # reformulation runs at temperature 0
+        self._reformulation_cache: OrderedDict = OrderedDict()
+        self._reformulation_cache_size = 256
+        self._reformulation_cache_lock = threading.Lock()
 
         # System prompts
         self.reformulation_prompt = """You are a query reformulator. Given the conversation history and the latest user question,
@@ -54,19 +89,38 @@ FORMAT YOUR RESPONSE AS:
 If information is not found, respond with:
 **Answer:** Not found in the document."""
 
-    def reformulate_query(self, query: str) -> str:
+    @property
+    def async_openai_client(self) -> AsyncOpenAI:
         """
-        Reformulate query using conversation history for context.
+        Async OpenAI client used by the *_async methods, one per running
+        event loop so that each asyncio.run() gets a working client.
         """
-        if not self.conversation_history:
-            return query
-
-        # Build conversation context
-        history_text = ""
-        for turn in self.conversation_history[-4:]:  # Last 4 turns
-            history_text += f"User: {turn['user']}\nAssistant: {turn['assistant'][:200]}...\n\n"
+        if self._async_openai_client is not None:
+            return self._async_openai_client
+        loop = asyncio.get_running_loop()
+        client = self._loop_async_clients.get(loop)
+        if client is None:
+            client = AsyncOpenAI(
+                api_key=os.getenv("OPENAI_API_KEY"),
+                http_client=httpx.AsyncClient(limits=httpx.Limits(max_connections=32))
+            )
+            self._loop_async_clients[loop] = client
+        return client
+
+    def _history_text(self) -> str:
+        """
+        Render the recent conversation history for the reformulation prompt.
+        """
+        return "".join(
+            f"User: {turn['user']}\nAssistant: {turn['assistant'][:200]}...\n\n"
+            for turn in self.conversation_history[-4:]  # Last 4 turns
+        )
 
-        messages = [
+    def _reformulation_messages(self, query: str, history_text: str) -> List[Dict[str, str]]:
+        """
+        Build the reformulation prompt from recent conversation history.
+        """
+        return [
             {"role": "system", "content": self.reformulation_prompt},
             {"role": "user", "content": f"""Conversation history:
 {history_text}
@@ -76,14 +130,95 @@ Latest question: {query}
 Reformulated question:"""}
         ]
 
+    @staticmethod
+    def _reformulation_key(history_text: str, query: str) -> bytes:
+        """
+        Cache key for a reformulation request.
+        """
+        return hashlib.blake2b(
+            (history_text + '\x00' + query).encode(), digest_size=16
+        ).digest()
+
+    def _cached_reformulation(self, key: bytes) -> Optional[str]:
+        """
+        Look up a cached reformulation, refreshing its LRU position.
+        """
+        with self._reformulation_cache_lock:
+            cached = self._reformulation_cache.get(key)
+            if cached is not None:
+                self._reformulation_cache.move_to_end(key)
+            return cached
+
+    def _store_reformulation(self, key: bytes, reformulated: str) -> None:
+        """
+        Cache a reformulation, evicting the least recently used entry.
+        """
+        with self._reformulation_cache_lock:
+            self._reformulation_cache[key] = reformulated
+            if len(self._reformulation_cache) > self._reformulation_cache_size:
+                self._reformulation_cache.popitem(last=False)
+
+    @staticmethod
+    def _needs_reformulation(query: str) -> bool:
+        """
+        Cheap check for whether a follow-up depends on conversation context:
+        short queries and ones with pronouns or continuation words.
+        """
+        return len(query.split()) < 6 or _FOLLOWUP_RE.search(query) is not None
+
+    def reformulate_query(self, query: str) -> str:
+        """
+        Reformulate query using conversation history for context.
+        """
+        if not self.conversation_history or not self._needs_reformulation(query):
+            return query
+
+        history_text = self._history_text()
+        key = self._reformulation_key(history_text, query)
+        cached = self._cached_reformulation(key)
+        if cached is not None:
+            return cached
+
         response = self.openai_client.chat.completions.create(
             model="gpt-4o-mini",  # Use smaller model for reformulation
-            messages=messages,
+            messages=self._reformulation_messages(query, history_text),
             temperature=0,
             max_tokens=200
         )
 
-        return response.choices[0].message.content.strip()
+        reformulated = response.choices[0].message.content.strip()
+        self._store_reformulation(key, reformulated)
+        return reformulated
+
+    async def reformulate_query_async(self, query: str) -> str:
+        """
+        Async version of reformulate_query.
+        """
+        if not self.conversation_history or not self._needs_reformulation(query):
+            return query
+
+        history_text = self._history_text()
+        key = self._reformulation_key(history_text, query)
+        cached = self._cached_reformulation(key)
+        if cached is not None:
+            return cached
+
+        response = await self.async_openai_client.chat.completions.create(
+            model="gpt-4o-mini",  # Use smaller model for reformulation
+            messages=self._reformulation_messages(query, history_text),
+            temperature=0,
+            max_tokens=200
+        )
+
+        reformulated = response.choices[0].message.content.strip()
+        self._store_reformulation(key, reformulated)
+        return reformulated
+
+    def retrieve(self, query: str, top_k: int = 5) -> List[Dict[str, Any]]:
+        """
+        Retrieve relevant chunks using hybrid search.
+        """
+        return self.retriever.search_hybrid(query, top_k=top_k)
 
     def build_context(self, retrieved_chunks: List[Dict[str, Any]]) -> str:
         """
@@ -100,17 +235,11 @@ Reformulated question:"""}
 
         return "\n\n---\n\n".join(context_parts)
 
-    def generate_answer(
-        self,
-        query: str,
-        context: str,
-        retrieved_chunks: List[Dict[str, Any]]
-    ) -> str:
+    def _answer_messages(self, query: str, context: str) -> List[Dict[str, str]]:
         """
-        Generate grounded answer with citations.
+        Build the grounded-answer prompt.
         """
-        # Build the prompt
-        messages = [
+        return [
             {"role": "system", "content": self.answer_prompt},
             {"role": "user", "content": f"""CONTEXT FROM DOCUMENT:
 {context}
@@ -124,20 +253,83 @@ Remember:
 """}
         ]
 
-        response = self.openai_client.chat.completions.create(
-            model=self.model,
-            messages=messages,
-            temperature=self.temperature,
-            max_tokens=1000
-        )
-
-        answer = response.choices[0].message.content.strip()
+    def generate_answer(
+        self,
+        query: str,
+        context: str,
+        retrieved_chunks: List[Dict[str, Any]],
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Generate grounded answer with citations.
+        If on_token is given, the completion is streamed and each text delta
+        is passed to it as it arrives.
+        """
+        if on_token is None:
+            response = self.openai_client.chat.completions.create(
+                model=self.model,
+                messages=self._answer_messages(query, context),
+                temperature=self.temperature,
+                max_tokens=1000
+            )
+            answer = response.choices[0].message.content.strip()
+        else:
+            stream = self.openai_client.chat.completions.create(
+                model=self.model,
+                messages=self._answer_messages(query, context),
+                temperature=self.temperature,
+                max_tokens=1000,
+                stream=True
+            )
+            parts = []
+            for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    on_token(delta)
+                    parts.append(delta)
+            answer = "".join(parts).strip()
 
         # Validate answer - check for hallucination signals
         answer = self._validate_answer(answer, retrieved_chunks)
 
         return answer
 
+    async def generate_answer_async(
+        self,
+        query: str,
+        context: str,
+        retrieved_chunks: List[Dict[str, Any]],
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> str:
+        """
+        Async version of generate_answer.
+        """
+        if on_token is None:
+            response = await self.async_openai_client.chat.completions.create(
+                model=self.model,
+                messages=self._answer_messages(query, context),
+                temperature=self.temperature,
+                max_tokens=1000
+            )
+            answer = response.choices[0].message.content.strip()
+        else:
+            stream = await self.async_openai_client.chat.completions.create(
+                model=self.model,
+                messages=self._answer_messages(query, context),
+                temperature=self.temperature,
+                max_tokens=1000,
+                stream=True
+            )
+            parts = []
+            async for chunk in stream:
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if delta:
+                    on_token(delta)
+                    parts.append(delta)
+            answer = "".join(parts).strip()
+
+        return self._validate_answer(answer, retrieved_chunks)
+
     def _validate_answer(
         self,
         answer: str,
@@ -154,17 +346,15 @@ Remember:
         lower_answer = answer.lower()
 
         # If answer already says not found, return it
-        if "not found in the document" in lower_answer:
+        if _NOT_FOUND in lower_answer:
             return answer
 
         # Check if answer has citations
-        has_citations = "[p" in answer or "[c" in answer
-
-        if not has_citations:
+        if _CITE_RE.search(answer) is None:
             # Try to add relevant citations based on what chunks were used
-            available_citations = [c['citation'] for c in retrieved_chunks[:3]]
-            if available_citations:
-                answer += f"\n\n*Sources: {', '.join(available_citations)}*"
+            # (retrieved_chunks is non-empty here)
+            sources = ', '.join(retrieved_chunks[i]['citation'] for i in range(min(3, len(retrieved_chunks))))
+            answer += f"\n\n*Sources: {sources}*"
 
         return answer
 
@@ -172,69 +362,156 @@ Remember:
         self,
         query: str,
         top_k: int = 5,
-        show_debug: bool = True
+        show_debug: bool = True,
+        on_token: Optional[Callable[[str], None]] = None
     ) -> Tuple[str, List[Dict[str, Any]]]:
         """
         Process a question and return answer with retrieved chunks.
+        Pass on_token to stream the answer as it is generated.
         """
-        # Step 1: Reformulate query if there's conversation history
-        reformulated_query = self.reformulate_query(query)
+        # Step 1: Reformulate query if it looks like a context-dependent follow-up
+        if self.conversation_history and self._needs_reformulation(query):
+            # Retrieve for the raw query while the reformulation call is in
+            # flight; the result is used whenever the query comes back unchanged
+            speculative = _retrieval_executor.submit(self.retrieve, query, top_k)
+            reformulated_query = self.reformulate_query(query)
+        else:
+            speculative = None
+            reformulated_query = query
 
         if show_debug and reformulated_query != query:
             print(f"\n[DEBUG] Reformulated query: {reformulated_query}")
 
         # Step 2: Retrieve relevant chunks using hybrid search
-        retrieved_chunks = self.retriever.search_hybrid(
-            reformulated_query,
-            top_k=top_k
-        )
+        if speculative is not None and reformulated_query == query:
+            retrieved_chunks = speculative.result()
+        else:
+            if speculative is not None:
+                speculative.cancel()
+            retrieved_chunks = self.retrieve(reformulated_query, top_k=top_k)
 
         # Step 3: Build context from retrieved chunks
         context = self.build_context(retrieved_chunks)
 
         # Step 4: Generate answer
-        answer = self.generate_answer(reformulated_query, context, retrieved_chunks)
+        answer = self.generate_answer(reformulated_query, context, retrieved_chunks, on_token)
+
+        # Step 5: Update conversation history
+        self._record_turn(query, answer, retrieved_chunks)
+
+        return answer, retrieved_chunks
+
+    async def ask_async(
+        self,
+        query: str,
+        top_k: int = 5,
+        show_debug: bool = True,
+        on_token: Optional[Callable[[str], None]] = None
+    ) -> Tuple[str, List[Dict[str, Any]]]:
+        """
+        Async version of ask. Retrieval runs in a worker thread so it can
+        overlap the reformulation request.
+        """
+        # Step 1: Reformulate query, retrieving for the raw query meanwhile
+        if self.conversation_history and self._needs_reformulation(query):
+            speculative = asyncio.ensure_future(asyncio.to_thread(self.retrieve, query, top_k))
+            reformulated_query = await self.reformulate_query_async(query)
+        else:
+            speculative = None
+            reformulated_query = query
+
+        if show_debug and reformulated_query != query:
+            print(f"\n[DEBUG] Reformulated query: {reformulated_query}")
+
+        # Step 2: Retrieve relevant chunks using hybrid search
+        if speculative is not None and reformulated_query == query:
+            retrieved_chunks = await speculative
+        else:
+            if speculative is not None:
+                speculative.cancel()
+            retrieved_chunks = await asyncio.to_thread(self.retrieve, reformulated_query, top_k)
+
+        # Steps 3-4: Build context and generate answer
+        context = self.build_context(retrieved_chunks)
+        answer = await self.generate_answer_async(
+            reformulated_query, context, retrieved_chunks, on_token
+        )
 
         # Step 5: Update conversation history
+        self._record_turn(query, answer, retrieved_chunks)
+
+        return answer, retrieved_chunks
+
+    async def ask_many(
+        self,
+        queries: List[str],
+        top_k: int = 5,
+        max_concurrency: int = 8
+    ) -> List[Tuple[str, List[Dict[str, Any]]]]:
+        """
+        Answer independent, self-contained questions concurrently.
+        Conversation history is neither used nor updated.
+        """
+        semaphore = asyncio.Semaphore(max_concurrency)
+
+        async def answer_one(query: str) -> Tuple[str, List[Dict[str, Any]]]:
+            async with semaphore:
+                retrieved_chunks = await asyncio.to_thread(self.retrieve, query, top_k)
+                context = self.build_context(retrieved_chunks)
+                answer = await self.generate_answer_async(query, context, retrieved_chunks)
+                return answer, retrieved_chunks
+
+        return await asyncio.gather(*(answer_one(query) for query in queries))
+
+    def _record_turn(
+        self,
+        query: str,
+        answer: str,
+        retrieved_chunks: List[Dict[str, Any]]
+    ) -> None:
+        """
+        Append a turn to the conversation history, trimming old turns.
+        """
+        # Only a preview of the answer is ever read back (for reformulation)
         self.conversation_history.append({
             'user': query,
-            'assistant': answer,
-            'retrieved_chunks': retrieved_chunks
+            'assistant': answer[:400]
         })
+        self.recent_retrievals.append(retrieved_chunks)
 
         # Trim history if too long
         if len(self.conversation_history) > self.max_history_turns:
             self.conversation_history = self.conversation_history[-self.max_history_turns:]
 
-        return answer, retrieved_chunks
-
     def display_retrieval_debug(self, retrieved_chunks: List[Dict[str, Any]]) -> None:
         """
         Display debug information about retrieved chunks.
         """
-        print("\n" + "=" * 60)
-        print("RETRIEVAL DEBUG INFO")
-        print("=" * 60)
+        # Collect the report and print it once rather than line by line
+        lines = ["\n" + "=" * 60, "RETRIEVAL DEBUG INFO", "=" * 60]
 
         if not retrieved_chunks:
-            print("No chunks retrieved.")
+            lines.append("No chunks retrieved.")
+            print("\n".join(lines))
             return
 
         for i, chunk in enumerate(retrieved_chunks, 1):
-            print(f"\n--- Chunk {i} {chunk['citation']} ---")
-            print(f"Page: {chunk['page_num']}, Chunk ID: {chunk['chunk_id']}")
-            print(f"Scores - Vector: {chunk.get('vector_score', 'N/A')}, "
-                  f"BM25: {chunk.get('bm25_score', 'N/A')}, "
-                  f"Combined: {chunk.get('combined_score', 'N/A')}")
-            print(f"Text snippet: {chunk['text'][:300]}...")
+            lines.append(f"\n--- Chunk {i} {chunk['citation']} ---")
+            lines.append(f"Page: {chunk['page_num']}, Chunk ID: {chunk['chunk_id']}")
+            lines.append(f"Scores - Vector: {_format_score(chunk.get('vector_score'))}, "
+                         f"BM25: {_format_score(chunk.get('bm25_score'))}, "
+                         f"Combined: {_format_score(chunk.get('combined_score'))}")
+            lines.append(f"Text snippet: {chunk['text'][:300]}...")
 
-        print("\n" + "=" * 60)
+        lines.append("\n" + "=" * 60)
+        print("\n".join(lines))
 
     def clear_history(self) -> None:
         """
         Clear conversation history.
         """
         self.conversation_history = []
+        self.recent_retrievals.clear()
 
 
 def format_answer_for_display(answer: str) -> str:
@@ -256,6 +533,13 @@ def format_answer_for_display(answer: str) -> str:
     return '\n'.join(formatted)
 
 
+def _format_score(score: Optional[float]) -> str:
+    """
+    Format a retrieval score to four decimals for display.
+    """
+    return "N/A" if score is None else f"{score:.4f}"
+
+
 if __name__ == "__main__":
     # Quick test
     from retriever import HybridRetriever
@@ -3,10 +3,163 @@ Text Chunking Module
 Implements smart chunking with overlap and metadata preservation.
 """
 
-from typing import List, Dict, Any
+import os
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import List, Dict, Any, Tuple
 import re
+import numpy as np
 import tiktoken
 
+# Optional: compile the chunk-planning loop with numba when it is installed
+try:
+    from numba import njit
+except ImportError:
+    njit = None
+
+# Use tiktoken for accurate token counting (GPT compatible). The encoder is
+# loaded once per process and shared by all chunkers.
+try:
+    _TOKENIZER = tiktoken.get_encoding("cl100k_base")
+except:
+    _TOKENIZER = None
+
+
+# Sentence-splitting and delimiter patterns, compiled once at import
+_SENT_SPLIT_RE = re.compile(r'(?<=[.!?])\s+')
+# A known abbreviation ending exactly at a candidate boundary. It is searched
+# in a short window before the boundary; \b still sees the preceding text.
+_ABBR_TAIL_RE = re.compile(r'\b(?:Mr|Mrs|Ms|Dr|Prof|Inc|Ltd|Corp|vs|etc|e\.g|i\.e|Rs|Cr|Mn|Bn)\.\Z')
+_ABBR_MAX_LEN = len("Prof.")
+_DELIM_RE = re.compile(r'[;,]\s*')
+
+# Below this many texts, tiktoken's per-call thread pool costs more than it saves
+_BATCH_ENCODE_MIN = 256
+
+
+@lru_cache(maxsize=100_000)
+def count_tokens(text: str) -> int:
+    """Count tokens in text, memoized since sentences repeat across calls."""
+    if _TOKENIZER:
+        # encode_ordinary: plain text, no special-token scanning
+        return len(_TOKENIZER.encode_ordinary(text))
+    # Fallback: rough estimate
+    return len(text.split())
+
+
+def count_tokens_batch(texts: List[str]) -> List[int]:
+    """Count tokens for many texts, batching the BPE work across threads."""
+    num_threads = os.cpu_count() or 1
+    if _TOKENIZER and num_threads > 1 and len(texts) >= _BATCH_ENCODE_MIN:
+        return [len(ids) for ids in _TOKENIZER.encode_ordinary_batch(texts, num_threads=num_threads)]
+    return [count_tokens(text) for text in texts]
+
+
+def _plan_chunks(sizes: np.ndarray, chunk_size: int, chunk_overlap: int) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Plan chunk boundaries over per-sentence token sizes.
+    Returns (starts, ends, totals): chunk k covers sentences[starts[k]:ends[k]]
+    and totals[k] tokens. A single sentence larger than chunk_size is emitted
+    as its own range, for the caller to split further.
+    """
+    n = len(sizes)
+    # Each sentence closes at most one chunk and adds at most one oversized range
+    starts = np.empty(2 * n + 1, dtype=np.int64)
+    ends = np.empty(2 * n + 1, dtype=np.int64)
+    totals = np.empty(2 * n + 1, dtype=np.int64)
+    count = 0
+    start = 0
+    current_size = 0
+
+    for i in range(n):
+        size = sizes[i]
+        # If single sentence exceeds chunk size, emit current chunk and the sentence
+        if size > chunk_size:
+            if i > start:
+                starts[count] = start
+                ends[count] = i
+                totals[count] = current_size
+                count += 1
+            starts[count] = i
+            ends[count] = i + 1
+            totals[count] = size
+            count += 1
+            start = i + 1
+            current_size = 0
+            continue
+
+        # Close the current chunk, keeping trailing sentences as overlap
+        if current_size + size > chunk_size and i > start:
+            starts[count] = start
+            ends[count] = i
+            totals[count] = current_size
+            count += 1
+
+            overlap_size = 0
+            j = i
+            while j > start and overlap_size + sizes[j - 1] <= chunk_overlap:
+                j -= 1
+                overlap_size += sizes[j]
+            start = j
+            current_size = overlap_size
+
+        current_size += size
+
+    # Don't forget the last chunk
+    if n > start:
+        starts[count] = start
+        ends[count] = n
+        totals[count] = current_size
+        count += 1
+
+    return starts[:count], ends[:count], totals[:count]
+
+
+if njit is not None:
+    _plan_chunks = njit(cache=True)(_plan_chunks)
+
+
+@dataclass
+class ChunkStore:
+    """
+    Columnar (structure-of-arrays) storage for an indexed chunk set.
+    Row i across the columns is one chunk; per-chunk dicts are only
+    materialized for the rows a caller asks for.
+    """
+    chunk_ids: np.ndarray
+    page_nums: np.ndarray
+    token_counts: np.ndarray
+    texts: List[str]
+    citations: List[str]
+
+    @classmethod
+    def from_chunks(cls, chunks: List[Dict[str, Any]]) -> "ChunkStore":
+        """Build a store from chunk dicts as produced by chunk_pages."""
+        return cls(
+            chunk_ids=np.fromiter((c['chunk_id'] for c in chunks), dtype=np.int32, count=len(chunks)),
+            page_nums=np.fromiter((c['page_num'] for c in chunks), dtype=np.int32, count=len(chunks)),
+            token_counts=np.fromiter((c.get('token_count', 0) for c in chunks), dtype=np.int32, count=len(chunks)),
+            texts=[c['text'] for c in chunks],
+            citations=[c['citation'] for c in chunks]
+        )
+
+    def __len__(self) -> int:
+        return len(self.texts)
+
+    def chunk(self, idx: int) -> Dict[str, Any]:
+        """Materialize one row as a chunk dict."""
+        return {
+            'chunk_id': int(self.chunk_ids[idx]),
+            'page_num': int(self.page_nums[idx]),
+            'text': self.texts[idx],
+            'citation': self.citations[idx],
+            'token_count': int(self.token_counts[idx])
+        }
+
+    def to_chunks(self) -> List[Dict[str, Any]]:
+        """Materialize every row as a chunk dict."""
+        return [self.chunk(i) for i in range(len(self))]
+
 
 class TextChunker:
     """
@@ -23,53 +176,66 @@ class TextChunker:
         self.chunk_overlap = chunk_overlap
         self.min_chunk_size = min_chunk_size
 
-        # Use tiktoken for accurate token counting (GPT compatible)
-        try:
-            self.tokenizer = tiktoken.get_encoding("cl100k_base")
-        except:
-            self.tokenizer = None
+        self.tokenizer = _TOKENIZER
 
     def count_tokens(self, text: str) -> int:
         """Count tokens in text."""
-        if self.tokenizer:
-            return len(self.tokenizer.encode(text))
-        # Fallback: rough estimate
-        return len(text.split())
+        return count_tokens(text)
 
     def split_into_sentences(self, text: str) -> List[str]:
         """
         Split text into sentences while handling common edge cases.
         """
-        # Handle common abbreviations
-        text = re.sub(r'(\b(?:Mr|Mrs|Ms|Dr|Prof|Inc|Ltd|Corp|vs|etc|e\.g|i\.e|Rs|Cr|Mn|Bn))\.', r'\1<PERIOD>', text)
-
-        # Handle numbers with decimals
-        text = re.sub(r'(\d+)\.(\d+)', r'\1<DECIMAL>\2', text)
-
-        # Split on sentence boundaries
-        sentences = re.split(r'(?<=[.!?])\s+', text)
+        # Single pass over the boundary matches; abbreviations are detected in
+        # place rather than masked and restored. Decimals ("3.5") never match
+        # a boundary since the split requires whitespace after the period.
+        sentences = []
+        start = 0
+
+        for boundary in _SENT_SPLIT_RE.finditer(text):
+            end = boundary.start()
+            if _ABBR_TAIL_RE.search(text, max(start, end - _ABBR_MAX_LEN), end):
+                continue
+            sentence = text[start:end].strip()
+            if sentence:
+                sentences.append(sentence)
+            start = boundary.end()
 
-        # Restore periods
-        sentences = [s.replace('<PERIOD>', '.').replace('<DECIMAL>', '.') for s in sentences]
+        sentence = text[start:].strip()
+        if sentence:
+            sentences.append(sentence)
 
-        return [s.strip() for s in sentences if s.strip()]
+        return sentences
 
-    def chunk_pages(self, pages_data: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    def chunk_pages(self, pages_data: List[Dict[str, Any]], start_id: int = 0) -> List[Dict[str, Any]]:
         """
         Chunk all pages and return chunks with metadata.
+        Chunk IDs are numbered from start_id, so pages can be chunked in
+        successive calls.
         """
         all_chunks = []
-        chunk_id = 0
+        chunk_id = start_id
 
+        pages = []
         for page in pages_data:
-            page_num = page['page_num']
             text = page['text']
-
             if not text or len(text.strip()) < self.min_chunk_size:
                 continue
+            pages.append((page['page_num'], text, self.split_into_sentences(text)))
+
+        # Size every sentence in the document with one batched tokenizer call
+        sizes = count_tokens_batch([sentence for _, _, sentences in pages for sentence in sentences])
+        offset = 0
+
+        for page_num, text, sentences in pages:
+            page_sizes = sizes[offset:offset + len(sentences)]
+            offset += len(sentences)
 
             # Get chunks for this page
-            page_chunks = self._chunk_text(text)
+            if sentences:
+                page_chunks = self._chunk_text(sentences, page_sizes)
+            else:
+                page_chunks = [text]
 
             for chunk_text in page_chunks:
                 if len(chunk_text.strip()) >= self.min_chunk_size:
@@ -77,68 +243,32 @@ class TextChunker:
                         'chunk_id': chunk_id,
                         'page_num': page_num,
                         'text': chunk_text.strip(),
-                        'token_count': self.count_tokens(chunk_text),
                         'citation': f"[p{page_num}:c{chunk_id}]"
                     })
                     chunk_id += 1
 
+        # Exact token counts for the final chunk texts, in one batched call
+        for chunk, token_count in zip(all_chunks, count_tokens_batch([c['text'] for c in all_chunks])):
+            chunk['token_count'] = token_count
+
         return all_chunks
 
-    def _chunk_text(self, text: str) -> List[str]:
+    def _chunk_text(self, sentences: List[str], sizes: List[int]) -> List[str]:
         """
-        Chunk text respecting sentence boundaries with overlap.
+        Chunk sentences (with precomputed token sizes) respecting sentence
+        boundaries with overlap.
         """
-        sentences = self.split_into_sentences(text)
-
-        if not sentences:
-            return [text] if text.strip() else []
+        # The compiled kernel wants an array; interpreted, a list indexes faster
+        sizes_in = np.asarray(sizes, dtype=np.int64) if njit is not None else sizes
+        starts, ends, totals = _plan_chunks(sizes_in, self.chunk_size, self.chunk_overlap)
 
         chunks = []
-        current_chunk = []
-        current_size = 0
-
-        for sentence in sentences:
-            sentence_size = self.count_tokens(sentence)
-
-            # If single sentence exceeds chunk size, split it
-            if sentence_size > self.chunk_size:
-                # First, save current chunk if not empty
-                if current_chunk:
-                    chunks.append(' '.join(current_chunk))
-                    current_chunk = []
-                    current_size = 0
-
+        for start, end, total in zip(starts.tolist(), ends.tolist(), totals.tolist()):
+            if end - start == 1 and total > self.chunk_size:
                 # Split long sentence into smaller parts
-                chunks.extend(self._split_long_sentence(sentence))
-                continue
-
-            # Check if adding this sentence exceeds chunk size
-            if current_size + sentence_size > self.chunk_size:
-                # Save current chunk
-                if current_chunk:
-                    chunks.append(' '.join(current_chunk))
-
-                    # Keep overlap sentences for next chunk
-                    overlap_sentences = []
-                    overlap_size = 0
-
-                    for s in reversed(current_chunk):
-                        s_size = self.count_tokens(s)
-                        if overlap_size + s_size <= self.chunk_overlap:
-                            overlap_sentences.insert(0, s)
-                            overlap_size += s_size
-                        else:
-                            break
-
-                    current_chunk = overlap_sentences
-                    current_size = overlap_size
-
-            current_chunk.append(sentence)
-            current_size += sentence_size
-
-        # Don't forget the last chunk
-        if current_chunk:
-            chunks.append(' '.join(current_chunk))
+                chunks.extend(self._split_long_sentence(sentences[start]))
+            else:
+                chunks.append(' '.join(sentences[start:end]))
 
         return chunks
 
@@ -147,15 +277,13 @@ class TextChunker:
         Split a sentence that's too long into smaller parts.
         """
         # Split by common delimiters
-        parts = re.split(r'[;,]\s*', sentence)
+        parts = _DELIM_RE.split(sentence)
 
         chunks = []
         current = []
         current_size = 0
 
-        for part in parts:
-            part_size = self.count_tokens(part)
-
+        for part, part_size in zip(parts, count_tokens_batch(parts)):
             if current_size + part_size > self.chunk_size:
                 if current:
                     chunks.append(', '.join(current))
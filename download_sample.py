@@ -3,8 +3,8 @@
 Download the sample PDF for testing.
 """
 
-import urllib.request
 import os
+from downloader import download_file
 
 SAMPLE_PDF_URL = "https://www.adanienterprises.com/-/media/Project/Enterprises/Investors/Investor-Downloads/Results-Presentations/AEL_Earnings_Presentation_Q2-FY26.pdf"
 OUTPUT_PATH = "./doc.pdf"
@@ -23,8 +23,7 @@ def download_pdf():
     print("This may take a moment...")
 
     try:
-        urllib.request.urlretrieve(SAMPLE_PDF_URL, OUTPUT_PATH)
-        file_size = os.path.getsize(OUTPUT_PATH)
+        file_size = download_file(SAMPLE_PDF_URL, OUTPUT_PATH)
         print(f"Downloaded successfully: {OUTPUT_PATH} ({file_size / 1024:.1f} KB)")
     except Exception as e:
         print(f"Error downloading: {e}")
@@ -0,0 +1,34 @@
+"""
+Ingest Worker Module
+Extract-and-chunk task for PDF uploads, run in worker processes by app.py.
+Kept apart from the web app so that workers started by the forkserver only
+import the extraction and chunking modules, not Flask and ChromaDB.
+"""
+
+from typing import Any, Dict, List, Tuple
+from pdf_processor import extract_text_from_pdf
+from chunker import create_chunks
+
+
+def process_pdf(path, filename: str, multi: bool) -> Tuple[List[Dict[str, Any]], int]:
+    """
+    Extract and chunk a single PDF. Returns (chunks, page count).
+    """
+    # Multi-file uploads already use one process per file. Uploads are saved
+    # under unique paths, so the path-keyed extraction cache could never hit
+    pages_data = extract_text_from_pdf(path, max_workers=1 if multi else None, use_cache=False)
+
+    # Add source filename to page data for better citations
+    for page in pages_data:
+        page['source_file'] = filename
+
+    chunks = create_chunks(pages_data, chunk_size=500, chunk_overlap=100)
+
+    # Update chunk citations to include filename for multi-file scenarios
+    if multi:
+        short_name = filename[:20] + '...' if len(filename) > 20 else filename
+        for chunk in chunks:
+            chunk['source_file'] = filename
+            chunk['citation'] = f"[{short_name}:p{chunk['page_num']}:c{chunk['chunk_id']}]"
+
+    return chunks, len(pages_data)
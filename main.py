@@ -19,18 +19,30 @@ Features:
 
 import os
 import sys
+import queue
 import argparse
-from typing import Optional
+import threading
+from typing import Optional, Tuple
 from dotenv import load_dotenv
 
 # Load environment variables from .env file
 load_dotenv()
 
-from pdf_processor import extract_text_from_pdf, get_pdf_metadata
-from chunker import create_chunks
+from pdf_processor import iter_document, preload_worker_modules
+from chunker import TextChunker
 from retriever import HybridRetriever
 from chat_agent import ConversationalAgent, format_answer_for_display
 
+# Chunks per add_chunks() call in the ingestion pipeline (one embeddings
+# request each); small enough that indexing starts on the first pages
+INDEX_BATCH_SIZE = 256
+# Pages per chunk_pages() call in the pipeline; enough sentences per call
+# for the batched token counter to kick in
+CHUNK_PAGE_BATCH = 16
+# Seconds between stop-flag checks while a pipeline queue is full or empty
+_QUEUE_POLL_INTERVAL = 0.1
+_END_OF_STREAM = None
+
 
 class RAGChatbot:
     """
@@ -77,27 +89,26 @@ class RAGChatbot:
         print(f"{'='*60}")
 
         try:
-            # Get metadata
-            metadata = get_pdf_metadata(pdf_path)
-            print(f"Pages: {metadata.get('num_pages', 'Unknown')}")
-
-            # Extract text from PDF
-            print("\nExtracting text from PDF...")
-            pages_data = extract_text_from_pdf(pdf_path)
-            print(f"Extracted text from {len(pages_data)} pages")
-
-            # Create chunks
-            print("\nChunking text...")
-            chunks = create_chunks(
-                pages_data,
-                chunk_size=self.chunk_size,
-                chunk_overlap=self.chunk_overlap
-            )
-            print(f"Created {len(chunks)} chunks")
-
-            # Index chunks
-            print("\nIndexing chunks...")
-            self.retriever.index_chunks(chunks, force_reindex=force_reindex)
+            # Reuse an existing index unless reindexing was requested
+            if not self.retriever.begin_indexing(force_reindex=force_reindex):
+                self.is_indexed = True
+                self.document_name = os.path.basename(pdf_path)
+                print(f"{'='*60}\n")
+                return True
+
+            # Extract, chunk and index as a pipeline, so embedding requests for
+            # the first pages go out while later pages are still being parsed
+            print("\nExtracting, chunking and indexing...")
+            num_pages, num_chunks = self._run_ingest_pipeline(pdf_path)
+            print(f"Extracted text from {num_pages} pages")
+            print(f"Created {num_chunks} chunks")
+            if num_chunks == 0:
+                # Scanned or empty PDF: keep the previous index rather than
+                # swapping in an empty one
+                self.retriever.abort_indexing()
+                print("Error: no text could be extracted from the PDF; index left unchanged")
+                return False
+            self.retriever.finish_indexing()
 
             self.is_indexed = True
             self.document_name = os.path.basename(pdf_path)
@@ -108,11 +119,117 @@ class RAGChatbot:
             return True
 
         except Exception as e:
+            # Keep the previous index rather than a partial one
+            self.retriever.abort_indexing()
             print(f"Error during ingestion: {e}")
             import traceback
             traceback.print_exc()
             return False
 
+    def _run_ingest_pipeline(self, pdf_path: str) -> Tuple[int, int]:
+        """
+        Feed pages from an extractor thread through a chunker thread into
+        retriever.add_chunks() on the calling thread. Returns (pages, chunks).
+        """
+        page_q = queue.Queue(maxsize=8)
+        chunk_q = queue.Queue(maxsize=8)
+        # Set when the indexer stops early so the producers give up instead
+        # of blocking forever on full queues
+        stop = threading.Event()
+        errors = []
+        num_pages = 0
+
+        def put(q: queue.Queue, item) -> bool:
+            while not stop.is_set():
+                try:
+                    q.put(item, timeout=_QUEUE_POLL_INTERVAL)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def get(q: queue.Queue):
+            while not stop.is_set():
+                try:
+                    return q.get(timeout=_QUEUE_POLL_INTERVAL)
+                except queue.Empty:
+                    pass
+            return _END_OF_STREAM
+
+        def extract() -> None:
+            nonlocal num_pages
+            try:
+                # Metadata comes first, from the same open as the pages
+                document = iter_document(pdf_path)
+                metadata = next(document)
+                print(f"Pages: {metadata.get('num_pages', 'Unknown')}")
+                for page in document:
+                    num_pages += 1
+                    if not put(page_q, page):
+                        return
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(page_q, _END_OF_STREAM)
+
+        def chunk() -> None:
+            chunker = TextChunker(chunk_size=self.chunk_size, chunk_overlap=self.chunk_overlap)
+            next_id = 0
+            pages = []
+
+            def flush() -> None:
+                nonlocal next_id
+                chunks = chunker.chunk_pages(pages, start_id=next_id)
+                pages.clear()
+                next_id += len(chunks)
+                if chunks:
+                    put(chunk_q, chunks)
+
+            try:
+                while (page := get(page_q)) is not _END_OF_STREAM:
+                    pages.append(page)
+                    if len(pages) >= CHUNK_PAGE_BATCH:
+                        flush()
+                if pages and not stop.is_set():
+                    flush()
+            except Exception as e:
+                errors.append(e)
+            finally:
+                put(chunk_q, _END_OF_STREAM)
+
+        threads = [threading.Thread(target=target, daemon=True) for target in (extract, chunk)]
+        for thread in threads:
+            thread.start()
+
+        num_chunks = 0
+        batch = []
+        try:
+            while (chunks := chunk_q.get()) is not _END_OF_STREAM:
+                batch.extend(chunks)
+                while len(batch) >= INDEX_BATCH_SIZE:
+                    self.retriever.add_chunks(batch[:INDEX_BATCH_SIZE])
+                    num_chunks += INDEX_BATCH_SIZE
+                    batch = batch[INDEX_BATCH_SIZE:]
+            if batch:
+                self.retriever.add_chunks(batch)
+                num_chunks += len(batch)
+        finally:
+            # Release producers that are blocked on a full queue, then wait
+            # for them so nothing keeps extracting after we return
+            stop.set()
+            for q in (page_q, chunk_q):
+                while True:
+                    try:
+                        q.get_nowait()
+                    except queue.Empty:
+                        break
+            for thread in threads:
+                thread.join()
+
+        if errors:
+            raise errors[0]
+        return num_pages, num_chunks
+
     def check_existing_index(self) -> bool:
         """
         Check if there's an existing index.
@@ -128,8 +245,8 @@ class RAGChatbot:
                         self.retriever.collection = self.retriever.chroma_client.get_collection("document_chunks")
                         self.retriever._rebuild_bm25_from_collection()
                         return True
-        except:
-            pass
+        except Exception as e:
+            print(f"Could not load existing index: {e}")
         return False
 
     def chat(self, show_debug: bool = True) -> None:
@@ -184,24 +301,42 @@ class RAGChatbot:
                     print("  /help     - Show this help message")
                     continue
 
-                # Process question
+                # Process question, streaming the answer as it arrives
                 print("\nSearching document...")
+                streamed = []
+
+                def print_token(delta: str) -> None:
+                    if not streamed:
+                        print("\n" + "-"*60)
+                        print("ASSISTANT:")
+                    streamed.append(delta)
+                    sys.stdout.write(delta)
+                    sys.stdout.flush()
+
                 answer, retrieved_chunks = self.agent.ask(
                     user_input,
                     top_k=5,
-                    show_debug=show_debug
+                    show_debug=show_debug,
+                    on_token=print_token
                 )
 
+                # Validation may append sources or replace the answer outright
+                streamed_text = "".join(streamed).strip()
+                if not streamed:
+                    print("\n" + "-"*60)
+                    print("ASSISTANT:")
+                    print(format_answer_for_display(answer))
+                elif answer.startswith(streamed_text):
+                    print(answer[len(streamed_text):])
+                else:
+                    print("\n")
+                    print(format_answer_for_display(answer))
+                print("-"*60)
+
                 # Show retrieval debug if enabled
                 if show_debug:
                     self.agent.display_retrieval_debug(retrieved_chunks)
 
-                # Display answer
-                print("\n" + "-"*60)
-                print("ASSISTANT:")
-                print(format_answer_for_display(answer))
-                print("-"*60)
-
             except KeyboardInterrupt:
                 print("\n\nInterrupted. Type /quit to exit.")
                 continue
@@ -215,11 +350,11 @@ def download_pdf(url: str, output_path: str) -> bool:
     """
     Download PDF from URL.
     """
-    import urllib.request
+    from downloader import download_file
 
     print(f"Downloading PDF from {url}...")
     try:
-        urllib.request.urlretrieve(url, output_path)
+        download_file(url, output_path)
         print(f"Downloaded to {output_path}")
         return True
     except Exception as e:
@@ -297,6 +432,8 @@ Examples:
         print("Or create a .env file with OPENAI_API_KEY=your-key-here")
         sys.exit(1)
 
+    preload_worker_modules()
+
     # Initialize chatbot
     chatbot = RAGChatbot(
         chunk_size=args.chunk_size,
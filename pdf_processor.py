@@ -4,53 +4,282 @@ Handles extraction of text from PDFs with page-level metadata.
 Uses pdfplumber for better table and layout handling.
 """
 
+import os
+import glob
+import hashlib
+import multiprocessing
+import pickle
+import zlib
+from concurrent.futures import ProcessPoolExecutor
 import pdfplumber
-from typing import List, Dict, Any
+from typing import List, Dict, Any, Optional, Iterator, Tuple
 import re
 
+# Whitespace patterns for clean_text, compiled once at import
+_SPACES_RE = re.compile(r' +')
+_NL_RE = re.compile(r'\n{3,}')
 
-def extract_text_from_pdf(pdf_path: str) -> List[Dict[str, Any]]:
+# Shorter PDFs are extracted serially; process start-up would dominate
+_PARALLEL_MIN_PAGES = 4
+
+# Start method for worker process pools. Forking a process that already runs
+# threads (ingest pipeline stages, gunicorn gthread workers, HTTP client
+# pools) can deadlock on locks those threads hold, so workers come from a
+# forkserver (spawn where unavailable).
+MP_CONTEXT = multiprocessing.get_context(
+    "forkserver" if "forkserver" in multiprocessing.get_all_start_methods() else "spawn"
+)
+# Imported once by the forkserver so each worker starts quickly. Not
+# "__main__": that would re-run a script without a __main__ guard
+FORKSERVER_PRELOAD = ["pdf_processor", "chunker", "ingest_worker"]
+
+
+def preload_worker_modules() -> None:
+    """
+    Have the forkserver import the extraction modules up front. Called by
+    the entry points (main.py, the web server), before the first pool starts.
+    """
+    if MP_CONTEXT.get_start_method() == "forkserver":
+        MP_CONTEXT.set_forkserver_preload(FORKSERVER_PRELOAD)
+
+# On-disk cache of extraction results, keyed on the file's identity and
+# evicted least-recently-used first once it grows past the size limit
+PDF_CACHE_DIR = "./.pdf_cache"
+PDF_CACHE_MAX_BYTES = 1024 ** 3
+
+
+def extract_text_from_pdf(
+    pdf_path: str,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True
+) -> List[Dict[str, Any]]:
     """
     Extract text from PDF with page numbers.
     Returns list of dicts with 'page_num', 'text', and 'tables' keys.
+    Pages are extracted across up to max_workers processes (default: all cores).
+    Results are reused from PDF_CACHE_DIR while the file is unchanged.
     """
-    pages_data = []
+    return list(iter_pages(pdf_path, max_workers=max_workers, use_cache=use_cache))
+
+
+def extract_all(
+    pdf_path: str,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True
+) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+    """
+    Return (metadata, pages) as from get_pdf_metadata and
+    extract_text_from_pdf, opening the PDF only once.
+    """
+    document = iter_document(pdf_path, max_workers=max_workers, use_cache=use_cache)
+    metadata = next(document)
+    return metadata, list(document)
+
+
+def iter_pages(
+    pdf_path: str,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """
+    Like extract_text_from_pdf, but yields pages in order as they are
+    extracted so that downstream work can start on the first pages early.
+    """
+    document = iter_document(pdf_path, max_workers=max_workers, use_cache=use_cache)
+    next(document)
+    yield from document
+
 
+def iter_document(
+    pdf_path: str,
+    max_workers: Optional[int] = None,
+    use_cache: bool = True
+) -> Iterator[Dict[str, Any]]:
+    """
+    Yield the PDF's metadata dict first, then its pages in order as they are
+    extracted, all from a single pdfplumber.open.
+    """
+    cache_key = _cache_key(pdf_path) if use_cache else None
+    if cache_key:
+        metadata = _load_cached(cache_key, "meta")
+        pages_data = _load_cached(cache_key, "pages") if metadata is not None else None
+        if pages_data is not None:
+            yield metadata
+            yield from pages_data
+            return
+
+    pages_data = []
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            for page_num, page in enumerate(pdf.pages, start=1):
-                # Extract main text
-                text = page.extract_text() or ""
-
-                # Extract tables separately for better handling
-                tables = []
-                page_tables = page.extract_tables()
-                if page_tables:
-                    for table in page_tables:
-                        if table:
-                            # Convert table to text format
-                            table_text = convert_table_to_text(table)
-                            tables.append(table_text)
-
-                # Combine text and tables
-                full_text = text
-                if tables:
-                    full_text += "\n\n[TABLE DATA]\n" + "\n".join(tables)
-
-                # Clean up the text
-                full_text = clean_text(full_text)
-
-                pages_data.append({
-                    'page_num': page_num,
-                    'text': full_text,
-                    'has_tables': len(tables) > 0
-                })
-
+            metadata = _read_metadata(pdf)
+            yield metadata
+            for page in _iter_extracted_pages(pdf, pdf_path, max_workers):
+                pages_data.append(page)
+                yield page
     except Exception as e:
         print(f"Error processing PDF: {e}")
         raise
 
-    return pages_data
+    if cache_key:
+        _store_cached(cache_key, "meta", metadata)
+        _store_cached(cache_key, "pages", pages_data)
+
+
+def _iter_extracted_pages(pdf, pdf_path: str, max_workers: Optional[int]) -> Iterator[Dict[str, Any]]:
+    """
+    Run the page extraction on an open PDF, serially or across a process pool.
+    """
+    num_pages = len(pdf.pages)
+    workers = min(max_workers or os.cpu_count() or 1, num_pages)
+    if num_pages < _PARALLEL_MIN_PAGES or workers <= 1:
+        for page_num, page in enumerate(pdf.pages, start=1):
+            yield _extract_page(page, page_num)
+        return
+
+    # Contiguous page ranges so each task opens the PDF once; a few ranges
+    # per worker keep the cores busy when some pages are much heavier
+    num_ranges = min(num_pages, workers * 4)
+    bounds = [num_pages * i // num_ranges for i in range(num_ranges + 1)]
+
+    with ProcessPoolExecutor(max_workers=workers, mp_context=MP_CONTEXT) as executor:
+        for pages in executor.map(
+            _extract_page_range, [pdf_path] * num_ranges, bounds[:-1], bounds[1:]
+        ):
+            yield from pages
+
+
+def _read_metadata(pdf) -> Dict[str, Any]:
+    """
+    Page count and document info of an open PDF.
+    """
+    metadata = {'num_pages': len(pdf.pages)}
+    if pdf.metadata:
+        metadata.update(pdf.metadata)
+    return metadata
+
+
+def _cache_key(pdf_path: str) -> Optional[str]:
+    """
+    Key a PDF on its path, mtime, size and first 64 KiB.
+    """
+    try:
+        stat = os.stat(pdf_path)
+        with open(pdf_path, 'rb') as f:
+            head = f.read(64 * 1024)
+    except OSError:
+        return None
+    identity = f"{os.path.abspath(pdf_path)}|{stat.st_mtime_ns}|{stat.st_size}".encode()
+    return hashlib.blake2b(identity + head, digest_size=16).hexdigest()
+
+
+def _load_cached(cache_key: str, kind: str) -> Optional[Any]:
+    """
+    Load a cached result, or None on a miss.
+    """
+    cache_path = os.path.join(PDF_CACHE_DIR, f"{cache_key}.{kind}.pkl.z")
+    try:
+        with open(cache_path, 'rb') as f:
+            value = pickle.loads(zlib.decompress(f.read()))
+        # Mark as recently used for eviction
+        os.utime(cache_path)
+        return value
+    except FileNotFoundError:
+        return None
+    except Exception as e:
+        print(f"Ignoring unreadable PDF cache entry: {e}")
+        return None
+
+
+def _store_cached(cache_key: str, kind: str, value: Any) -> None:
+    """
+    Persist a result, then trim the cache directory to PDF_CACHE_MAX_BYTES.
+    """
+    cache_path = os.path.join(PDF_CACHE_DIR, f"{cache_key}.{kind}.pkl.z")
+    # Unique temp name: extraction may run in several processes at once
+    tmp_path = f"{cache_path}.{os.getpid()}.tmp"
+    try:
+        os.makedirs(PDF_CACHE_DIR, exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            f.write(zlib.compress(pickle.dumps(value, protocol=pickle.HIGHEST_PROTOCOL), 1))
+        os.replace(tmp_path, cache_path)
+    except Exception as e:
+        print(f"Could not cache PDF extraction: {e}")
+        return
+    finally:
+        # Only left behind if the write failed; *.tmp files are never evicted
+        try:
+            os.remove(tmp_path)
+        except OSError:
+            pass
+
+    _evict_cached()
+
+
+def _evict_cached() -> None:
+    """
+    Delete least recently used cache files until the directory fits in
+    PDF_CACHE_MAX_BYTES. Other processes may evict or replace files
+    concurrently, so entries that disappear are skipped.
+    """
+    try:
+        entries = []
+        for path in glob.glob(os.path.join(PDF_CACHE_DIR, "*.pkl.z")):
+            try:
+                stat = os.stat(path)
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, path))
+        total = sum(size for _, size, _ in entries)
+        for _, size, path in sorted(entries):
+            if total <= PDF_CACHE_MAX_BYTES:
+                break
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+            total -= size
+    except OSError as e:
+        print(f"Could not trim PDF cache: {e}")
+
+
+def _extract_page_range(pdf_path: str, start: int, stop: int) -> List[Dict[str, Any]]:
+    """
+    Extract pages [start, stop) (0-based). Runs in a worker process.
+    """
+    with pdfplumber.open(pdf_path) as pdf:
+        return [_extract_page(pdf.pages[i], i + 1) for i in range(start, stop)]
+
+
+def _extract_page(page, page_num: int) -> Dict[str, Any]:
+    """
+    Extract text and tables from a single pdfplumber page.
+    """
+    # Extract main text
+    text = page.extract_text() or ""
+
+    # Extract tables separately for better handling
+    tables = []
+    page_tables = page.extract_tables()
+    if page_tables:
+        for table in page_tables:
+            if table:
+                # Convert table to text format
+                table_text = convert_table_to_text(table)
+                tables.append(table_text)
+
+    # Combine text and tables
+    full_text = text
+    if tables:
+        full_text += "\n\n[TABLE DATA]\n" + "\n".join(tables)
+
+    # Clean up the text
+    full_text = clean_text(full_text)
+
+    return {
+        'page_num': page_num,
+        'text': full_text,
+        'has_tables': len(tables) > 0
+    }
 
 
 def convert_table_to_text(table: List[List]) -> str:
@@ -80,10 +309,10 @@ def clean_text(text: str) -> str:
         return ""
 
     # Replace multiple spaces with single space
-    text = re.sub(r' +', ' ', text)
+    text = _SPACES_RE.sub(' ', text)
 
     # Replace multiple newlines with double newline
-    text = re.sub(r'\n{3,}', '\n\n', text)
+    text = _NL_RE.sub('\n\n', text)
 
     # Remove leading/trailing whitespace from each line
     lines = [line.strip() for line in text.split('\n')]
@@ -96,15 +325,22 @@ def get_pdf_metadata(pdf_path: str) -> Dict[str, Any]:
     """
     Extract metadata from PDF.
     """
+    cache_key = _cache_key(pdf_path)
+    if cache_key:
+        metadata = _load_cached(cache_key, "meta")
+        if metadata is not None:
+            return metadata
+
     metadata = {}
     try:
         with pdfplumber.open(pdf_path) as pdf:
-            metadata['num_pages'] = len(pdf.pages)
-            if pdf.metadata:
-                metadata.update(pdf.metadata)
+            metadata = _read_metadata(pdf)
     except Exception as e:
         print(f"Error extracting metadata: {e}")
+        return metadata
 
+    if cache_key:
+        _store_cached(cache_key, "meta", metadata)
     return metadata
 
 
@@ -4,12 +4,93 @@ Combines BM25 (sparse) and vector (dense) retrieval for better results.
 """
 
 import os
+import glob
+import email.utils
+import hashlib
+import json
+import math
+import random
+import re
+import sqlite3
+import threading
+import time
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timezone
 from typing import List, Dict, Any, Tuple, Optional
 import numpy as np
-from rank_bm25 import BM25Okapi
 import chromadb
 from chromadb.config import Settings
-from openai import OpenAI
+from openai import OpenAI, RateLimitError, APIConnectionError, InternalServerError
+from chunker import ChunkStore, count_tokens_batch
+from bm25 import SparseBM25
+
+# Default model for the local ONNX backend (int8-quantized, batched internally)
+FASTEMBED_DEFAULT_MODEL = "BAAI/bge-small-en-v1.5"
+
+# Per-request limits of the embeddings endpoint: at most this many inputs,
+# and at most this many tokens summed over them
+EMBEDDING_BATCH_SIZE = 2048
+EMBEDDING_BATCH_MAX_TOKENS = 300_000
+# Embedding requests in flight per get_embeddings call, and attempts each
+# (first try included) on rate limits and transient errors; backoff doubles
+# from 1s and every wait, Retry-After too, is capped at 30s
+EMBEDDING_CONCURRENCY = 4
+EMBEDDING_MAX_ATTEMPTS = 5
+EMBEDDING_RETRY_INITIAL_DELAY = 1.0
+EMBEDDING_RETRY_MAX_DELAY = 30.0
+
+# Rows per SELECT when reading the embedding cache (SQLite's default
+# limit on bound parameters is 999)
+EMBEDDING_CACHE_LOOKUP_BATCH = 500
+
+# BM25 tokens: lowercased runs of word characters
+_TOKEN_RE = re.compile(r'\b\w+\b')
+
+# Version of the bm25_<collection>.npz layout; a mismatch forces a rebuild
+BM25_INDEX_FORMAT = 1
+
+
+def _retry_after_seconds(response) -> Optional[float]:
+    """
+    Seconds to wait from a response's Retry-After header, given either as
+    delta-seconds or as an HTTP date; None if absent or unparseable.
+    """
+    value = response.headers.get("retry-after") if response is not None else None
+    if not value:
+        return None
+    try:
+        seconds = float(value)
+        return seconds if math.isfinite(seconds) else None
+    except ValueError:
+        pass
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return None
+    if retry_at.tzinfo is None:
+        retry_at = retry_at.replace(tzinfo=timezone.utc)
+    return (retry_at - datetime.now(timezone.utc)).total_seconds()
+
+
+def _pack_strings(strings: List[str]) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Encode strings as one UTF-8 byte array plus character offsets, so they
+    can go into an npz file without pickling.
+    """
+    offsets = np.zeros(len(strings) + 1, dtype=np.int64)
+    np.cumsum([len(s) for s in strings], out=offsets[1:])
+    blob = "".join(strings).encode('utf-8', 'surrogatepass')
+    return np.frombuffer(blob, dtype=np.uint8), offsets
+
+
+def _unpack_strings(blob: np.ndarray, offsets: np.ndarray) -> List[str]:
+    """
+    Inverse of _pack_strings.
+    """
+    joined = blob.tobytes().decode('utf-8', 'surrogatepass')
+    bounds = offsets.tolist()
+    return [joined[start:end] for start, end in zip(bounds[:-1], bounds[1:])]
 
 
 class HybridRetriever:
@@ -21,14 +102,28 @@ class HybridRetriever:
         self,
         collection_name: str = "document_chunks",
         persist_directory: str = "./chroma_db",
-        embedding_model: str = "text-embedding-3-small"
+        embedding_model: str = "text-embedding-3-small",
+        embedding_backend: Optional[str] = None,
+        openai_client: Optional[OpenAI] = None
     ):
         self.collection_name = collection_name
         self.persist_directory = persist_directory
         self.embedding_model = embedding_model
 
-        # Initialize OpenAI client
-        self.openai_client = OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # "openai" (default) or "fastembed" for local ONNX embeddings
+        self.embedding_backend = embedding_backend or os.getenv("EMBEDDING_BACKEND", "openai")
+        self.local_embedder = None
+        if self.embedding_backend == "fastembed":
+            from fastembed import TextEmbedding
+            if embedding_model == "text-embedding-3-small":
+                self.embedding_model = FASTEMBED_DEFAULT_MODEL
+            self.local_embedder = TextEmbedding(model_name=self.embedding_model)
+
+        # Initialize OpenAI client (or share the caller's connection pool)
+        self.openai_client = openai_client or OpenAI(api_key=os.getenv("OPENAI_API_KEY"))
+        # _embed_one_batch does its own retrying; the SDK's retries would
+        # multiply the attempts and ignore the jitter
+        self._embedding_client = self.openai_client.with_options(max_retries=0)
 
         # Initialize ChromaDB
         self.chroma_client = chromadb.PersistentClient(
@@ -38,67 +133,197 @@ class HybridRetriever:
 
         # BM25 components (will be initialized when documents are added)
         self.bm25 = None
-        self.chunks = []
-        self.tokenized_corpus = []
-
-    def get_embeddings(self, texts: List[str]) -> List[List[float]]:
+        self.chunks = ChunkStore.from_chunks([])
+
+        # Collection, chunks and embeddings of an incremental build
+        # (begin/add/finish_indexing); the live collection keeps serving until
+        # finish_indexing swaps the staging one in
+        self._staging_collection = None
+        self._pending_chunks: List[Dict[str, Any]] = []
+        self._pending_embeddings: Dict[str, np.ndarray] = {}
+        # Held from begin_indexing() until finish/abort_indexing(), so that
+        # concurrent uploads build one after the other instead of sharing the
+        # staging collection and pending state
+        self._indexing_lock = threading.Lock()
+        self._index_build_active = False
+
+        # Persistent cache of chunk embeddings keyed by model and text, so a
+        # forced reindex only pays for chunks that actually changed
+        self._emb_cache_path = os.path.join(persist_directory, "emb_cache.sqlite")
+
+        # Persisted BM25 index and chunk columns, plus a JSON sidecar tying
+        # them to a collection and corpus; one pair per collection, so that
+        # collections sharing a persist_directory don't overwrite each other
+        self._bm25_path = os.path.join(persist_directory, f"bm25_{collection_name}.npz")
+        self._bm25_meta_path = os.path.join(persist_directory, f"bm25_{collection_name}.json")
+
+        # LRU cache of hybrid search results, keyed by normalized query and
+        # index generation so that any reindex invalidates old entries
+        self._search_cache: OrderedDict = OrderedDict()
+        self._search_cache_size = 512
+        self._search_cache_lock = threading.Lock()
+        self._index_generation = 0
+
+        # Runs the network-bound half of search_hybrid
+        self._search_executor = ThreadPoolExecutor(max_workers=4, thread_name_prefix="vector-search")
+
+        # Query embeddings don't depend on the index, so they are cached per
+        # retriever for its whole lifetime, keyed by (model, query)
+        self._query_embedding_cache: OrderedDict = OrderedDict()
+        self._query_embedding_cache_size = 512
+        self._query_embedding_cache_lock = threading.Lock()
+
+    def get_embeddings(self, texts: List[str]) -> np.ndarray:
         """
-        Get embeddings from OpenAI API.
+        Get embeddings from OpenAI API, or from the local ONNX model, as one
+        (len(texts), dim) float32 array.
         """
-        # Process in batches to avoid rate limits
-        batch_size = 100
-        all_embeddings = []
+        if self.local_embedder is not None:
+            return np.array(list(self.local_embedder.embed(texts, batch_size=256)), dtype=np.float32)
 
-        for i in range(0, len(texts), batch_size):
-            batch = texts[i:i + batch_size]
-            response = self.openai_client.embeddings.create(
-                model=self.embedding_model,
-                input=batch
-            )
-            batch_embeddings = [item.embedding for item in response.data]
-            all_embeddings.extend(batch_embeddings)
+        # Process in batches, a few in flight at once; map keeps input order
+        batches = self._embedding_batches(texts)
+        if not batches:
+            return np.empty((0, 0), dtype=np.float32)
+        if len(batches) == 1:
+            return self._embed_one_batch(batches[0])
+
+        with ThreadPoolExecutor(max_workers=min(EMBEDDING_CONCURRENCY, len(batches))) as executor:
+            return np.concatenate(list(executor.map(self._embed_one_batch, batches)))
 
-        return all_embeddings
+    @staticmethod
+    def _embedding_batches(texts: List[str]) -> List[List[str]]:
+        """
+        Split texts into the fewest in-order batches within the endpoint's
+        input-count and token limits.
+        """
+        batches = []
+        batch = []
+        batch_tokens = 0
+        for text, tokens in zip(texts, count_tokens_batch(texts)):
+            if batch and (len(batch) == EMBEDDING_BATCH_SIZE or batch_tokens + tokens > EMBEDDING_BATCH_MAX_TOKENS):
+                batches.append(batch)
+                batch = []
+                batch_tokens = 0
+            batch.append(text)
+            batch_tokens += tokens
+        if batch:
+            batches.append(batch)
+        return batches
+
+    def _embed_one_batch(self, batch: List[str]) -> np.ndarray:
+        """
+        Embed one batch with the OpenAI API, retrying rate limits, connection
+        errors, timeouts and 5xx responses so one bad batch doesn't abort an
+        index build.
+        """
+        for attempt in range(EMBEDDING_MAX_ATTEMPTS):
+            try:
+                response = self._embedding_client.embeddings.create(
+                    model=self.embedding_model,
+                    input=batch
+                )
+                return np.array([item.embedding for item in response.data], dtype=np.float32)
+            # APIConnectionError includes APITimeoutError
+            except (RateLimitError, APIConnectionError, InternalServerError) as e:
+                if attempt == EMBEDDING_MAX_ATTEMPTS - 1:
+                    raise
+                # Honour the server's Retry-After, else back off exponentially
+                # with jitter so concurrent batches don't retry in lockstep
+                delay = _retry_after_seconds(getattr(e, "response", None))
+                if delay is None:
+                    delay = EMBEDDING_RETRY_INITIAL_DELAY * 2 ** attempt + random.uniform(0, EMBEDDING_RETRY_INITIAL_DELAY)
+                time.sleep(min(max(delay, 0.0), EMBEDDING_RETRY_MAX_DELAY))
+
+    def embed_query(self, query: str) -> np.ndarray:
+        """
+        Embed a single search query, reusing recent results.
+        """
+        key = (self.embedding_model, query)
+        with self._query_embedding_cache_lock:
+            cached = self._query_embedding_cache.get(key)
+            if cached is not None:
+                self._query_embedding_cache.move_to_end(key)
+                return cached
+
+        embedding = self.get_embeddings([query])[0]
+        # Shared by every caller through the cache
+        embedding.flags.writeable = False
+
+        with self._query_embedding_cache_lock:
+            self._query_embedding_cache[key] = embedding
+            if len(self._query_embedding_cache) > self._query_embedding_cache_size:
+                self._query_embedding_cache.popitem(last=False)
+        return embedding
 
     def tokenize(self, text: str) -> List[str]:
         """
         Simple tokenization for BM25.
         """
         # Lowercase and split by non-alphanumeric characters
-        import re
-        tokens = re.findall(r'\b\w+\b', text.lower())
-        return tokens
+        return _TOKEN_RE.findall(text.lower())
 
     def index_chunks(self, chunks: List[Dict[str, Any]], force_reindex: bool = False) -> None:
         """
         Index chunks for both vector and BM25 retrieval.
         """
-        self.chunks = chunks
-
-        # Check if collection exists
-        existing_collections = [c.name for c in self.chroma_client.list_collections()]
-
-        if self.collection_name in existing_collections and not force_reindex:
-            # Load existing collection
-            self.collection = self.chroma_client.get_collection(name=self.collection_name)
-            print(f"Loaded existing collection with {self.collection.count()} documents")
-
-            # Rebuild BM25 from stored chunks
-            self._rebuild_bm25_from_collection()
+        if not self.begin_indexing(force_reindex):
             return
 
-        # Delete if exists and force_reindex
-        if self.collection_name in existing_collections:
-            self.chroma_client.delete_collection(name=self.collection_name)
+        print(f"Indexing {len(chunks)} chunks...")
+        try:
+            self.add_chunks(chunks)
+            self.finish_indexing()
+        except Exception:
+            self.abort_indexing()
+            raise
 
-        # Create new collection
-        self.collection = self.chroma_client.create_collection(
-            name=self.collection_name,
-            metadata={"hnsw:space": "cosine"}
-        )
+    def begin_indexing(self, force_reindex: bool = False) -> bool:
+        """
+        Start an incremental index build: feed chunks with add_chunks() and
+        complete with finish_indexing(), or discard with abort_indexing(). The
+        chunks go into a staging collection, so an existing index stays intact
+        until the build completes. If a collection already exists and
+        force_reindex is not set, it is loaded instead and False is returned.
+        Waits for any build already in progress on this retriever.
+        """
+        self._indexing_lock.acquire()
+        try:
+            # Check if collection exists
+            existing_collections = [c.name for c in self.chroma_client.list_collections()]
+
+            if self.collection_name in existing_collections and not force_reindex:
+                # Load existing collection
+                self.collection = self.chroma_client.get_collection(name=self.collection_name)
+                print(f"Loaded existing collection with {self.collection.count()} documents")
+
+                # Rebuild BM25 from stored chunks
+                self._rebuild_bm25_from_collection()
+                self._indexing_lock.release()
+                return False
+
+            # Drop what an interrupted build left behind, then build into a fresh
+            # staging collection
+            staging_name = self._staging_collection_name()
+            if staging_name in existing_collections:
+                self.chroma_client.delete_collection(name=staging_name)
+            self._staging_collection = self.chroma_client.create_collection(
+                name=staging_name,
+                metadata={"hnsw:space": "cosine"}
+            )
+        except BaseException:
+            self._indexing_lock.release()
+            raise
 
-        print(f"Indexing {len(chunks)} chunks...")
+        self._pending_chunks = []
+        self._pending_embeddings = {}
+        self._index_build_active = True
+        return True
 
+    def add_chunks(self, chunks: List[Dict[str, Any]]) -> None:
+        """
+        Embed a batch of chunks and add it to the collection being built.
+        """
         # Prepare data for ChromaDB
         texts = [chunk['text'] for chunk in chunks]
         ids = [str(chunk['chunk_id']) for chunk in chunks]
@@ -112,59 +337,304 @@ class HybridRetriever:
             for chunk in chunks
         ]
 
-        # Get embeddings
-        print("Generating embeddings...")
-        embeddings = self.get_embeddings(texts)
-
-        # Add to ChromaDB in batches
-        batch_size = 100
+        # Get embeddings, embedding repeated boilerplate (headers, footers)
+        # only once across all batches of this build
+        new_texts = [text for text in dict.fromkeys(texts) if text not in self._pending_embeddings]
+        if new_texts:
+            cached = self._load_cached_embeddings(new_texts)
+            self._pending_embeddings.update(cached)
+            to_embed = [text for text in new_texts if text not in cached]
+            if cached:
+                print(f"Reusing cached embeddings for {len(cached)} chunks")
+            if to_embed:
+                print(f"Generating embeddings for {len(to_embed)} unique chunks...")
+                fresh = dict(zip(to_embed, self.get_embeddings(to_embed)))
+                self._pending_embeddings.update(fresh)
+                self._store_cached_embeddings(fresh)
+        embeddings = np.stack([self._pending_embeddings[text] for text in texts])
+
+        # Add to ChromaDB in the largest batches the client accepts (usually a
+        # single call)
+        batch_size = self._chroma_max_batch_size()
         for i in range(0, len(chunks), batch_size):
             end_idx = min(i + batch_size, len(chunks))
-            self.collection.add(
+            self._staging_collection.add(
                 ids=ids[i:end_idx],
                 embeddings=embeddings[i:end_idx],
                 documents=texts[i:end_idx],
                 metadatas=metadatas[i:end_idx]
             )
 
-        print(f"Indexed {len(chunks)} chunks in ChromaDB")
+        self._pending_chunks.extend(chunks)
 
-        # Build BM25 index
-        self._build_bm25_index(texts)
+    def _embedding_cache_key(self, text: str) -> str:
+        """
+        SHA-256 over the embedding model and the chunk text.
+        """
+        return hashlib.sha256((self.embedding_model + '\x00' + text).encode()).hexdigest()
+
+    def _open_embedding_cache(self) -> sqlite3.Connection:
+        """
+        Open the embedding cache, creating its table on first use.
+        """
+        os.makedirs(self.persist_directory, exist_ok=True)
+        conn = sqlite3.connect(self._emb_cache_path)
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings (hash TEXT PRIMARY KEY, model TEXT, vec BLOB)"
+        )
+        return conn
+
+    def _load_cached_embeddings(self, texts: List[str]) -> Dict[str, np.ndarray]:
+        """
+        Embeddings of the given texts found in the cache, by text.
+        """
+        keys = {self._embedding_cache_key(text): text for text in texts}
+        hashes = list(keys)
+        found = {}
+        try:
+            conn = self._open_embedding_cache()
+            try:
+                for i in range(0, len(hashes), EMBEDDING_CACHE_LOOKUP_BATCH):
+                    batch = hashes[i:i + EMBEDDING_CACHE_LOOKUP_BATCH]
+                    rows = conn.execute(
+                        f"SELECT hash, vec FROM embeddings WHERE hash IN ({','.join('?' * len(batch))})",
+                        batch
+                    )
+                    for key, vec in rows:
+                        found[keys[key]] = np.frombuffer(vec, dtype=np.float32)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Ignoring unreadable embedding cache: {e}")
+            return {}
+        return found
+
+    def _store_cached_embeddings(self, embeddings: Dict[str, np.ndarray]) -> None:
+        """
+        Add freshly computed embeddings to the cache.
+        """
+        rows = [
+            (self._embedding_cache_key(text), self.embedding_model, vec.tobytes())
+            for text, vec in embeddings.items()
+        ]
+        try:
+            conn = self._open_embedding_cache()
+            try:
+                with conn:
+                    conn.executemany("INSERT OR REPLACE INTO embeddings VALUES (?, ?, ?)", rows)
+            finally:
+                conn.close()
+        except sqlite3.Error as e:
+            print(f"Could not cache embeddings: {e}")
+
+    def _chroma_max_batch_size(self) -> int:
+        """
+        Largest add() the Chroma client accepts (get_max_batch_size() on
+        newer releases, the max_batch_size property on older ones).
+        """
+        if hasattr(self.chroma_client, "get_max_batch_size"):
+            return self.chroma_client.get_max_batch_size()
+        return getattr(self.chroma_client, "max_batch_size", 5461)
+
+    def finish_indexing(self) -> None:
+        """
+        Complete an incremental build: replace the live collection with the
+        staging one and index all added chunks for BM25.
+        """
+        try:
+            existing_collections = [c.name for c in self.chroma_client.list_collections()]
+            if self.collection_name in existing_collections:
+                self.chroma_client.delete_collection(name=self.collection_name)
+            self._staging_collection.modify(name=self.collection_name)
+            self.collection = self._staging_collection
+            self._staging_collection = None
+
+            self.chunks = ChunkStore.from_chunks(self._pending_chunks)
+            self._pending_chunks = []
+            self._pending_embeddings = {}
+
+            print(f"Indexed {len(self.chunks)} chunks in ChromaDB")
+
+            # Build BM25 index
+            self._build_bm25_index(self.chunks.texts)
+        finally:
+            self._end_index_build()
+
+    def abort_indexing(self) -> None:
+        """
+        Discard an unfinished build, leaving the live collection untouched.
+        """
+        if self._staging_collection is not None:
+            try:
+                self.chroma_client.delete_collection(name=self._staging_collection.name)
+            except Exception as e:
+                print(f"Could not remove staging collection: {e}")
+            self._staging_collection = None
+        self._pending_chunks = []
+        self._pending_embeddings = {}
+        self._end_index_build()
+
+    def _end_index_build(self) -> None:
+        """
+        Let the next build start; safe to call more than once per build.
+        """
+        if self._index_build_active:
+            self._index_build_active = False
+            self._indexing_lock.release()
+
+    def _staging_collection_name(self) -> str:
+        """
+        Name of the collection an incremental build writes into.
+        """
+        return f"{self.collection_name}_staging"
 
     def _build_bm25_index(self, texts: List[str]) -> None:
         """
-        Build BM25 index from texts.
+        Build BM25 index from texts, reusing the persisted index for an unchanged corpus.
+        """
+        self._invalidate_search_cache()
+
+        corpus_hash = hashlib.blake2b(
+            b"\x00".join(text.encode() for text in texts), digest_size=16
+        ).hexdigest()
+
+        meta = self._read_bm25_meta()
+        loaded = self._load_bm25_index() if meta and meta.get('corpus_hash') == corpus_hash else None
+        if loaded is not None:
+            self.bm25 = loaded[0]
+            print("Loaded cached BM25 index")
+        else:
+            # Token lists are only needed while building the postings
+            self.bm25 = SparseBM25([self.tokenize(text) for text in texts])
+            print("Built BM25 index")
+
+        # Persist (again, if reused: the collection and chunk columns may be new)
+        self._save_bm25_index(corpus_hash)
+
+    def _read_bm25_meta(self) -> Optional[Dict[str, Any]]:
+        """
+        The persisted BM25 index's JSON sidecar, or None if there is none.
+        """
+        try:
+            with open(self._bm25_meta_path, 'r', encoding='utf-8') as f:
+                meta = json.load(f)
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            print(f"Ignoring unreadable BM25 index metadata: {e}")
+            return None
+        return meta if meta.get('format') == BM25_INDEX_FORMAT else None
+
+    def _load_bm25_index(self) -> Optional[Tuple[SparseBM25, ChunkStore]]:
+        """
+        Load the persisted BM25 index and chunk columns, or None on failure.
+        """
+        try:
+            with np.load(self._bm25_path) as data:
+                arrays = {name: data[name] for name in data.files}
+            vocab = _unpack_strings(arrays['vocab_blob'], arrays['vocab_offsets'])
+            bm25 = SparseBM25.from_arrays(arrays, {term: i for i, term in enumerate(vocab)})
+            chunks = ChunkStore(
+                chunk_ids=arrays['chunk_ids'],
+                page_nums=arrays['page_nums'],
+                token_counts=arrays['token_counts'],
+                texts=_unpack_strings(arrays['text_blob'], arrays['text_offsets']),
+                citations=_unpack_strings(arrays['citation_blob'], arrays['citation_offsets'])
+            )
+        except Exception as e:
+            print(f"Ignoring unreadable BM25 index: {e}")
+            return None
+        return bm25, chunks
+
+    def _save_bm25_index(self, corpus_hash: str) -> None:
+        """
+        Persist the BM25 index with the chunk columns, so that a restart can
+        load both without reading the documents back from Chroma.
         """
-        self.tokenized_corpus = [self.tokenize(text) for text in texts]
-        self.bm25 = BM25Okapi(self.tokenized_corpus)
-        print("Built BM25 index")
+        vocab = sorted(self.bm25.vocab, key=self.bm25.vocab.get)
+        arrays = self.bm25.to_arrays()
+        arrays['vocab_blob'], arrays['vocab_offsets'] = _pack_strings(vocab)
+        arrays['text_blob'], arrays['text_offsets'] = _pack_strings(self.chunks.texts)
+        arrays['citation_blob'], arrays['citation_offsets'] = _pack_strings(self.chunks.citations)
+        arrays['chunk_ids'] = self.chunks.chunk_ids
+        arrays['page_nums'] = self.chunks.page_nums
+        arrays['token_counts'] = self.chunks.token_counts
+        meta = {
+            'format': BM25_INDEX_FORMAT,
+            'collection_id': str(self.collection.id) if self.collection else None,
+            'count': len(self.chunks),
+            'corpus_hash': corpus_hash
+        }
+
+        try:
+            os.makedirs(self.persist_directory, exist_ok=True)
+            # The sidecar marks the arrays as complete: drop it first, write it last
+            if os.path.exists(self._bm25_meta_path):
+                os.remove(self._bm25_meta_path)
+            # Pickled indexes from before the npz format
+            for stale in glob.glob(os.path.join(self.persist_directory, "bm25_*.pkl")):
+                os.remove(stale)
+
+            tmp_path = self._bm25_path + ".tmp"
+            with open(tmp_path, 'wb') as f:
+                np.savez(f, **arrays)
+            os.replace(tmp_path, self._bm25_path)
+
+            tmp_path = self._bm25_meta_path + ".tmp"
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(meta, f)
+            os.replace(tmp_path, self._bm25_meta_path)
+        except (OSError, UnicodeError) as e:
+            print(f"Could not cache BM25 index: {e}")
+
+    def _invalidate_search_cache(self) -> None:
+        """
+        Drop cached search results after the index changes.
+        """
+        with self._search_cache_lock:
+            self._index_generation += 1
+            self._search_cache.clear()
 
     def _rebuild_bm25_from_collection(self) -> None:
         """
         Rebuild BM25 index from ChromaDB collection.
         """
+        # The persisted index, if it was saved for this very collection,
+        # already holds everything; only fall back to reading the documents
+        meta = self._read_bm25_meta()
+        if (
+            meta
+            and meta.get('collection_id') == str(self.collection.id)
+            and meta.get('count') == self.collection.count()
+        ):
+            loaded = self._load_bm25_index()
+            if loaded is not None:
+                self._invalidate_search_cache()
+                self.bm25, self.chunks = loaded
+                print("Loaded persisted BM25 index")
+                return
+
         # Get all documents from collection
         results = self.collection.get(include=['documents', 'metadatas'])
 
         if results['documents']:
-            # Reconstruct chunks list
-            self.chunks = []
-            for i, (doc, meta) in enumerate(zip(results['documents'], results['metadatas'])):
-                self.chunks.append({
-                    'chunk_id': meta['chunk_id'],
-                    'page_num': meta['page_num'],
-                    'text': doc,
-                    'citation': meta['citation'],
-                    'token_count': meta.get('token_count', 0)
-                })
-
-            # Sort by chunk_id
-            self.chunks.sort(key=lambda x: x['chunk_id'])
+            # Reconstruct the chunk columns, ordered by chunk_id
+            metadatas = results['metadatas']
+            chunk_ids = np.fromiter((meta['chunk_id'] for meta in metadatas), dtype=np.int32, count=len(metadatas))
+            # Plain ints: indexing lists with numpy scalars is several times slower
+            order = np.argsort(chunk_ids, kind='stable').tolist()
+            documents = results['documents']
+            metadatas = [metadatas[i] for i in order]
+            self.chunks = ChunkStore(
+                chunk_ids=chunk_ids[order],
+                page_nums=np.array([meta['page_num'] for meta in metadatas], dtype=np.int32),
+                token_counts=np.array([meta.get('token_count', 0) for meta in metadatas], dtype=np.int32),
+                texts=[documents[i] for i in order],
+                citations=[meta['citation'] for meta in metadatas]
+            )
 
             # Build BM25
-            texts = [chunk['text'] for chunk in self.chunks]
-            self._build_bm25_index(texts)
+            self._build_bm25_index(self.chunks.texts)
 
     def search_vector(
         self,
@@ -178,7 +648,7 @@ class HybridRetriever:
             return []
 
         # Get query embedding
-        query_embedding = self.get_embeddings([query])[0]
+        query_embedding = self.embed_query(query)
 
         # Search ChromaDB
         results = self.collection.query(
@@ -226,20 +696,23 @@ class HybridRetriever:
         # Get BM25 scores
         scores = self.bm25.get_scores(query_tokens)
 
-        # Get top-k indices
-        top_indices = np.argsort(scores)[::-1][:top_k]
+        # Get top-k indices: partition out the k best, then sort only those
+        k = min(top_k, scores.size)
+        if k <= 0:
+            return []
+        top = np.argpartition(-scores, k - 1)[:k]
+        top_indices = top[np.argsort(-scores[top])]
 
         # Build results
         retrieved = []
         for idx in top_indices:
             if scores[idx] > 0:  # Only include if there's some match
-                chunk = self.chunks[idx]
                 retrieved.append((
                     {
-                        'text': chunk['text'],
-                        'page_num': chunk['page_num'],
-                        'chunk_id': chunk['chunk_id'],
-                        'citation': chunk['citation']
+                        'text': self.chunks.texts[idx],
+                        'page_num': int(self.chunks.page_nums[idx]),
+                        'chunk_id': int(self.chunks.chunk_ids[idx]),
+                        'citation': self.chunks.citations[idx]
                     },
                     float(scores[idx])
                 ))
@@ -256,63 +729,70 @@ class HybridRetriever:
         """
         Hybrid search combining vector and BM25 results.
         Uses Reciprocal Rank Fusion (RRF) for combining rankings.
+        Results are cached per normalized query until the index changes.
         """
-        # Get results from both methods (fetch more for fusion)
-        vector_results = self.search_vector(query, top_k=top_k * 2)
+        cache_key = (
+            self._index_generation, query.strip().lower(), top_k, vector_weight, bm25_weight
+        )
+        with self._search_cache_lock:
+            cached = self._search_cache.get(cache_key)
+            if cached is not None:
+                self._search_cache.move_to_end(cache_key)
+                return [dict(item) for item in cached]
+
+        # Get results from both methods (fetch more for fusion). The vector
+        # search waits on the embeddings API, so BM25 runs meanwhile.
+        vector_future = self._search_executor.submit(self.search_vector, query, top_k * 2)
         bm25_results = self.search_bm25(query, top_k=top_k * 2)
+        vector_results = vector_future.result()
 
         # Combine using RRF
         k = 60  # RRF constant
 
-        # Calculate RRF scores
-        rrf_scores = {}
+        # Calculate RRF scores, one flat dict per score keyed by chunk_id
+        rrf_scores: Dict[int, float] = {}
+        vector_scores: Dict[int, float] = {}
+        bm25_scores: Dict[int, float] = {}
+        chunks_by_id: Dict[int, Dict[str, Any]] = {}
 
         # Process vector results
         for rank, (chunk, score) in enumerate(vector_results):
-            chunk_key = chunk['chunk_id']
-            if chunk_key not in rrf_scores:
-                rrf_scores[chunk_key] = {
-                    'chunk': chunk,
-                    'vector_score': score,
-                    'bm25_score': 0,
-                    'rrf_score': 0
-                }
-            rrf_scores[chunk_key]['rrf_score'] += vector_weight / (k + rank + 1)
-            rrf_scores[chunk_key]['vector_score'] = score
+            chunk_id = chunk['chunk_id']
+            chunks_by_id[chunk_id] = chunk
+            vector_scores[chunk_id] = score
+            rrf_scores[chunk_id] = rrf_scores.get(chunk_id, 0) + vector_weight / (k + rank + 1)
 
         # Process BM25 results
         for rank, (chunk, score) in enumerate(bm25_results):
-            chunk_key = chunk['chunk_id']
-            if chunk_key not in rrf_scores:
-                rrf_scores[chunk_key] = {
-                    'chunk': chunk,
-                    'vector_score': 0,
-                    'bm25_score': score,
-                    'rrf_score': 0
-                }
-            rrf_scores[chunk_key]['rrf_score'] += bm25_weight / (k + rank + 1)
-            rrf_scores[chunk_key]['bm25_score'] = score
+            chunk_id = chunk['chunk_id']
+            chunks_by_id.setdefault(chunk_id, chunk)
+            bm25_scores[chunk_id] = score
+            rrf_scores[chunk_id] = rrf_scores.get(chunk_id, 0) + bm25_weight / (k + rank + 1)
 
         # Sort by RRF score
-        sorted_results = sorted(
-            rrf_scores.values(),
-            key=lambda x: x['rrf_score'],
-            reverse=True
-        )[:top_k]
+        sorted_ids = sorted(rrf_scores, key=rrf_scores.get, reverse=True)[:top_k]
 
         # Format results
         final_results = []
-        for item in sorted_results:
+        for chunk_id in sorted_ids:
+            chunk = chunks_by_id[chunk_id]
             final_results.append({
-                'text': item['chunk']['text'],
-                'page_num': item['chunk']['page_num'],
-                'chunk_id': item['chunk']['chunk_id'],
-                'citation': item['chunk']['citation'],
-                'vector_score': round(item['vector_score'], 4),
-                'bm25_score': round(item['bm25_score'], 4),
-                'combined_score': round(item['rrf_score'], 4)
+                'text': chunk['text'],
+                'page_num': chunk['page_num'],
+                'chunk_id': chunk_id,
+                'citation': chunk['citation'],
+                'vector_score': vector_scores.get(chunk_id, 0),
+                'bm25_score': bm25_scores.get(chunk_id, 0),
+                'combined_score': rrf_scores[chunk_id]
             })
 
+        with self._search_cache_lock:
+            # Skip the store if the index was rebuilt while we were searching
+            if cache_key[0] == self._index_generation:
+                self._search_cache[cache_key] = [dict(item) for item in final_results]
+                if len(self._search_cache) > self._search_cache_size:
+                    self._search_cache.popitem(last=False)
+
         return final_results
 
     def clear_index(self) -> None:
@@ -324,8 +804,8 @@ class HybridRetriever:
         except:
             pass
         self.bm25 = None
-        self.chunks = []
-        self.tokenized_corpus = []
+        self.chunks = ChunkStore.from_chunks([])
+        self._invalidate_search_cache()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,64 @@
+"""
+Chat Agent Tests
+The async API across event loops, against a local fake of the OpenAI API.
+"""
+
+import asyncio
+import json
+import threading
+import types
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from chat_agent import ConversationalAgent
+
+CHUNKS = [
+    {'chunk_id': 0, 'page_num': 1, 'text': 'Revenue increased by 20% year over year', 'citation': 'p1:c0'},
+]
+
+
+class FakeChatCompletions(BaseHTTPRequestHandler):
+    """
+    Answers every chat completion with a cited answer, over keep-alive HTTP/1.1.
+    """
+
+    protocol_version = "HTTP/1.1"
+
+    def do_POST(self):
+        self.rfile.read(int(self.headers['Content-Length']))
+        body = json.dumps({
+            'id': 'chatcmpl-test', 'object': 'chat.completion', 'created': 0, 'model': 'gpt-4o',
+            'choices': [{
+                'index': 0, 'finish_reason': 'stop',
+                'message': {'role': 'assistant', 'content': '**Answer:** Revenue grew 20% [p1:c0]'},
+            }],
+        }).encode()
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+@pytest.fixture
+def agent(monkeypatch):
+    server = ThreadingHTTPServer(('127.0.0.1', 0), FakeChatCompletions)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setenv("OPENAI_BASE_URL", f"http://127.0.0.1:{server.server_address[1]}/v1")
+    retriever = types.SimpleNamespace(search_hybrid=lambda query, top_k=5: CHUNKS)
+    yield ConversationalAgent(retriever)
+    server.shutdown()
+    server.server_close()
+
+
+def test_ask_many_works_across_event_loops(agent):
+    # Each asyncio.run() is a new event loop; pooled connections from the
+    # previous loop must not be reused
+    for _ in range(2):
+        results = asyncio.run(agent.ask_many(["How did revenue change?", "What was the growth?"]))
+        assert [answer for answer, _ in results] == ['**Answer:** Revenue grew 20% [p1:c0]'] * 2
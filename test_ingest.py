@@ -0,0 +1,141 @@
+"""
+Ingestion Tests
+A failed reindex must leave the previously indexed document in place.
+Run with pytest; the embeddings API is replaced by a local fake.
+"""
+
+import hashlib
+import threading
+import time
+import types
+
+import numpy as np
+
+import main
+import retriever as retriever_module
+from retriever import HybridRetriever
+
+OLD_CHUNKS = [
+    {'chunk_id': 0, 'page_num': 1, 'text': 'Revenue increased by 20% year over year', 'citation': '[p1:c0]', 'token_count': 8},
+    {'chunk_id': 1, 'page_num': 2, 'text': 'EBITDA margin improved to 15%', 'citation': '[p2:c1]', 'token_count': 6},
+]
+
+
+class FakeEmbeddingsClient:
+    """
+    Stands in for OpenAI(): deterministic 16-dim embeddings, no network.
+    """
+
+    def __init__(self):
+        self.embeddings = types.SimpleNamespace(create=self._create)
+
+    def with_options(self, **kwargs):
+        return self
+
+    @staticmethod
+    def _create(model, input):
+        return types.SimpleNamespace(data=[
+            types.SimpleNamespace(
+                embedding=(np.frombuffer(hashlib.sha256(text.encode()).digest()[:16], dtype=np.uint8) + 1.0).tolist()
+            )
+            for text in input
+        ])
+
+
+def index_old_document(tmp_path, monkeypatch):
+    """
+    Index OLD_CHUNKS with a fake embeddings client; returns (bot, pdf path).
+    """
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(retriever_module, "OpenAI", lambda **kwargs: FakeEmbeddingsClient())
+    persist_directory = str(tmp_path / "chroma_db")
+    HybridRetriever(persist_directory=persist_directory).index_chunks(OLD_CHUNKS, force_reindex=True)
+
+    pdf_path = tmp_path / "document.pdf"
+    pdf_path.write_bytes(b"%PDF-1.4")
+    return main.RAGChatbot(persist_directory=persist_directory), str(pdf_path)
+
+
+def assert_old_index_served(persist_directory):
+    """
+    A fresh start without --reindex serves the old document, complete.
+    """
+    reloaded = HybridRetriever(persist_directory=persist_directory)
+    assert [c.name for c in reloaded.chroma_client.list_collections()] == ["document_chunks"]
+    assert not reloaded.begin_indexing(force_reindex=False)
+    assert reloaded.collection.count() == len(OLD_CHUNKS)
+    assert reloaded.chunks.texts == [chunk['text'] for chunk in OLD_CHUNKS]
+
+
+def test_failed_reindex_keeps_previous_index(tmp_path, monkeypatch):
+    bot, pdf_path = index_old_document(tmp_path, monkeypatch)
+
+    # The extractor yields a page (which gets chunked and embedded) and then fails
+    def broken_document(pdf_path):
+        yield {'num_pages': 2}
+        yield {'page_num': 1, 'text': 'Passenger traffic grew strongly.', 'has_tables': False}
+        raise RuntimeError("corrupt PDF")
+
+    monkeypatch.setattr(main, "iter_document", broken_document)
+    assert not bot.ingest_pdf(pdf_path, force_reindex=True)
+    assert_old_index_served(bot.persist_directory)
+
+
+def test_reindex_without_text_keeps_previous_index(tmp_path, monkeypatch):
+    bot, pdf_path = index_old_document(tmp_path, monkeypatch)
+
+    # A scanned PDF: pages come through, but without any text
+    def scanned_document(pdf_path):
+        yield {'num_pages': 2}
+        for page_num in (1, 2):
+            yield {'page_num': page_num, 'text': '', 'has_tables': False}
+
+    monkeypatch.setattr(main, "iter_document", scanned_document)
+    assert not bot.ingest_pdf(pdf_path, force_reindex=True)
+    assert_old_index_served(bot.persist_directory)
+
+
+def test_indexing_failure_stops_pipeline_threads(tmp_path, monkeypatch):
+    bot, pdf_path = index_old_document(tmp_path, monkeypatch)
+
+    # Far more pages than the pipeline queues hold, so the producers would
+    # block on full queues once the indexer stops consuming
+    def long_document(pdf_path):
+        yield {'num_pages': 500}
+        for page_num in range(1, 501):
+            text = f'Page {page_num} reports revenue, margins and passenger traffic for the quarter.'
+            yield {'page_num': page_num, 'text': text, 'has_tables': False}
+
+    def failing_add_chunks(chunks):
+        raise RuntimeError("embeddings unavailable")
+
+    monkeypatch.setattr(main, "iter_document", long_document)
+    monkeypatch.setattr(main, "INDEX_BATCH_SIZE", 1)
+    monkeypatch.setattr(bot.retriever, "add_chunks", failing_add_chunks)
+    threads_before = set(threading.enumerate())
+    assert not bot.ingest_pdf(pdf_path, force_reindex=True)
+    assert set(threading.enumerate()) <= threads_before
+    assert_old_index_served(bot.persist_directory)
+
+
+def test_concurrent_builds_run_one_after_the_other(tmp_path, monkeypatch):
+    monkeypatch.setenv("OPENAI_API_KEY", "test")
+    monkeypatch.setattr(retriever_module, "OpenAI", lambda **kwargs: FakeEmbeddingsClient())
+    retriever = HybridRetriever(persist_directory=str(tmp_path / "chroma_db"))
+    new_chunks = [{'chunk_id': 0, 'page_num': 1, 'text': 'Passenger traffic grew strongly', 'citation': '[p1:c0]', 'token_count': 4}]
+
+    # A second upload arriving mid-build waits instead of sharing the staging collection
+    assert retriever.begin_indexing(force_reindex=True)
+    second = threading.Thread(target=retriever.index_chunks, args=(OLD_CHUNKS, True))
+    second.start()
+    time.sleep(0.2)
+    assert second.is_alive()
+
+    retriever.add_chunks(new_chunks)
+    retriever.finish_indexing()
+    assert retriever.collection.count() == len(new_chunks)
+
+    second.join(timeout=10)
+    assert not second.is_alive()
+    assert retriever.collection.count() == len(OLD_CHUNKS)
+    assert retriever.chunks.texts == [chunk['text'] for chunk in OLD_CHUNKS]
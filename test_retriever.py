@@ -0,0 +1,115 @@
+"""
+Retriever Tests
+Retry behaviour of embedding requests and BM25 persistence, against a fake
+OpenAI client.
+"""
+
+import types
+
+import httpx
+import openai
+import pytest
+
+import retriever as retriever_module
+from retriever import HybridRetriever, EMBEDDING_MAX_ATTEMPTS
+
+
+class FlakyEmbeddingsClient:
+    """
+    Raises the queued errors one call at a time, then returns embeddings.
+    """
+
+    def __init__(self, errors):
+        self.errors = list(errors)
+        self.calls = 0
+        self.options = []
+        self.embeddings = types.SimpleNamespace(create=self._create)
+
+    def with_options(self, **kwargs):
+        self.options.append(kwargs)
+        return self
+
+    def _create(self, model, input):
+        self.calls += 1
+        if self.errors:
+            raise self.errors.pop(0)
+        return types.SimpleNamespace(data=[types.SimpleNamespace(embedding=[1.0, 0.0]) for _ in input])
+
+
+def rate_limit_error(retry_after=None):
+    headers = {"retry-after": retry_after} if retry_after is not None else {}
+    request = httpx.Request("POST", "https://api.openai.com/v1/embeddings")
+    response = httpx.Response(429, headers=headers, request=request)
+    return openai.RateLimitError("rate limited", response=response, body=None)
+
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    recorded = []
+    monkeypatch.setattr(retriever_module.time, "sleep", recorded.append)
+    monkeypatch.setattr(retriever_module.random, "uniform", lambda a, b: 0.0)
+    return recorded
+
+
+def make_retriever(tmp_path, client):
+    return HybridRetriever(persist_directory=str(tmp_path / "chroma_db"), openai_client=client)
+
+
+def test_rate_limit_then_success_honours_retry_after(tmp_path, sleeps):
+    client = FlakyEmbeddingsClient([rate_limit_error("2")])
+    embeddings = make_retriever(tmp_path, client).get_embeddings(["a", "b"])
+
+    assert embeddings.shape == (2, 2)
+    assert client.calls == 2
+    assert sleeps == [2.0]
+    # The SDK's own retries are switched off in favour of this loop
+    assert client.options == [{'max_retries': 0}]
+
+
+def test_backoff_without_retry_after_and_clamping(tmp_path, sleeps):
+    client = FlakyEmbeddingsClient([
+        rate_limit_error(),
+        rate_limit_error("-5"),
+        rate_limit_error("86400"),
+        rate_limit_error("Wed, 21 Oct 2099 07:28:00 GMT")
+    ])
+    make_retriever(tmp_path, client).get_embeddings(["a"])
+
+    assert client.calls == 5
+    assert sleeps == [1.0, 0.0, 30.0, 30.0]
+
+
+def test_gives_up_after_max_attempts(tmp_path, sleeps):
+    client = FlakyEmbeddingsClient([rate_limit_error() for _ in range(EMBEDDING_MAX_ATTEMPTS)])
+    with pytest.raises(openai.RateLimitError):
+        make_retriever(tmp_path, client).get_embeddings(["a"])
+
+    assert client.calls == EMBEDDING_MAX_ATTEMPTS
+    assert sleeps == [1.0, 2.0, 4.0, 8.0]
+
+
+def test_collections_in_one_directory_keep_their_own_bm25_index(tmp_path, sleeps):
+    persist_directory = str(tmp_path / "chroma_db")
+    corpora = {
+        'alpha': ['Revenue increased by 20% year over year'],
+        'beta': ['Airport business saw passenger growth', 'EBITDA margin improved to 15%'],
+    }
+    for name, texts in corpora.items():
+        chunks = [
+            {'chunk_id': i, 'page_num': 1, 'text': text, 'citation': f'[p1:c{i}]', 'token_count': 6}
+            for i, text in enumerate(texts)
+        ]
+        HybridRetriever(
+            persist_directory=persist_directory, collection_name=name,
+            openai_client=FlakyEmbeddingsClient([])
+        ).index_chunks(chunks, force_reindex=True)
+
+    # Indexing beta left alpha's persisted index in place, so reloading alpha
+    # doesn't rebuild BM25 from the collection
+    reloaded = HybridRetriever(
+        persist_directory=persist_directory, collection_name='alpha',
+        openai_client=FlakyEmbeddingsClient([])
+    )
+    reloaded._build_bm25_index = lambda texts: pytest.fail("BM25 rebuilt instead of loaded")
+    assert not reloaded.begin_indexing(force_reindex=False)
+    assert reloaded.chunks.texts == corpora['alpha']